@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import signal
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from generate import generate_puzzle
+from lyner import *
+from lyner.utility import Board, CompactBoard, parse_image
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SOLVERS = {'guided':         lambda: GuidedDepthFirstSolver(),
+           'guided-prune':   lambda: GuidedDepthFirstSolver(prune=True),
+           'guided-table':   lambda: GuidedDepthFirstSolver(table_size=1000000),
+           'guided-all':     lambda: GuidedDepthFirstSolver(prune=True, table_size=1000000),
+           'compact':        lambda: GuidedDepthFirstSolver(compact=True),
+           'bidirectional':  lambda: BidirectionalSolver()}
+DEFAULT_SOLVERS = sorted(set(SOLVERS) - {'bidirectional'}) # Only on request, it is slower and needs more memory.
+
+GENERATED = [(3, 3, 1), (4, 4, 2), (5, 5, 3), (6, 6, 3), (7, 7, 3), (8, 8, 3), (10, 10, 3)]
+
+################################################################################
+### Corpus
+################################################################################
+
+def load_corpus(filename, generated, seeds):
+    corpus = []
+    with open(filename) as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                name, puzzle = line.split()
+                corpus.append((name, puzzle))
+    for rows, cols, colors in generated:
+        for seed in range(seeds):
+            name = 'gen-{0}x{1}-{2}c-{3}'.format(rows, cols, colors, seed)
+            corpus.append((name, generate_puzzle(rows, cols, colors, seed)))
+    return corpus
+
+################################################################################
+### Measurements
+################################################################################
+
+class _Timeout(Exception):
+    pass
+
+def _on_alarm(signum, frame):
+    raise _Timeout()
+
+def measure(func, timeout=None):
+    # Runs func once, returning its wall time, peak traced memory, result and
+    # status. Memory tracing slows down the run, so time is measured apart.
+    result = {}
+    for traced in (False, True):
+        if traced:
+            tracemalloc.start()
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        start = time.perf_counter()
+        try:
+            value, status = func(), 'ok'
+        except _Timeout:
+            value, status = None, 'timeout'
+        except LynerException:
+            value, status = None, 'failed'
+        finally:
+            elapsed = time.perf_counter() - start
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        if traced:
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            result.update(time=elapsed, status=status, value=value)
+            if status == 'timeout':
+                result['peak_memory'] = None
+                break # Don't wait for it twice.
+    return result
+
+def bench_solvers(corpus, solvers, timeout):
+    for name, puzzle in corpus:
+        for solver_name in solvers:
+            solver = SOLVERS[solver_name]()
+            result = measure(lambda: solver.solve_puzzle(puzzle), timeout)
+            stats = solver.stats if isinstance(getattr(solver, 'stats', None), SearchStats) else None
+            yield {'benchmark': 'solve', 'solver': solver_name, 'name': name, 'puzzle': puzzle,
+                   'time': result['time'], 'status': result['status'],
+                   'expanded': stats.expanded or None if stats else None, # Not counted by all solvers.
+                   'backtracks': stats.backtracks if stats else None,
+                   'max_depth': stats.max_depth if stats else None,
+                   'peak_memory': result['peak_memory']}
+
+def bench_boards(corpus, repeat):
+    for name, puzzle in corpus:
+        for board_name, board_class in (('board', Board), ('compact', CompactBoard)):
+            result = measure(lambda: [board_class(puzzle) for i in range(repeat)])
+            yield {'benchmark': 'board', 'board': board_name, 'name': name, 'puzzle': puzzle,
+                   'time': result['time'] / repeat, 'peak_memory': result['peak_memory']}
+
+def bench_images(images, repeat):
+    if images:
+        parse_image(images[0]) # Import PIL and NumPy, which are loaded lazily, before timing.
+    for image in images:
+        result = measure(lambda: [parse_image(image) for i in range(repeat)])
+        yield {'benchmark': 'parse_image', 'name': os.path.basename(image),
+               'puzzle': result['value'][0] if result['value'] else None,
+               'time': result['time'] / repeat, 'peak_memory': result['peak_memory']}
+
+################################################################################
+### Report
+################################################################################
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'date': datetime.datetime.now().isoformat(), 'commit': commit,
+            'python': platform.python_version(), 'platform': platform.platform()}
+
+def print_result(result):
+    label = result.get('solver') or result.get('board') or ''
+    expanded = result.get('expanded')
+    memory = result.get('peak_memory')
+    print('{0:<12} {1:<14} {2:<20} {3:>10.4f}s {4:>10} {5:>10} {6}'.format(
+          result['benchmark'], label, result['name'], result['time'],
+          expanded if expanded is not None else '-',
+          '{0}k'.format(memory // 1024) if memory is not None else '-',
+          result.get('status', '')))
+
+################################################################################
+### Arguments
+################################################################################
+
+parser = argparse.ArgumentParser(description='benchmark solvers, board construction and image parsing')
+parser.add_argument('-o', '--output', help='write results as JSON to a file', default='benchmark.json')
+parser.add_argument('-s', '--solver', help='solver configuration to benchmark (default: all but bidirectional)',
+                    choices=sorted(SOLVERS), action='append')
+parser.add_argument('--corpus', help='read official puzzles from a file',
+                    default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus.txt'))
+parser.add_argument('--seeds', help='generate N puzzles of every size', metavar='N', type=int, default=3)
+parser.add_argument('--max-size', help='only generate puzzles with up to N rows', metavar='N', type=int, default=8)
+parser.add_argument('--timeout', help='give up on a solve after N seconds', metavar='N', type=float, default=30)
+parser.add_argument('--repeat', help='repeat board construction and image parsing N times', metavar='N', type=int, default=10)
+parser.add_argument('--skip', help='skip a group of benchmarks', choices=('solve', 'board', 'parse_image'), action='append', default=[])
+args = parser.parse_args()
+
+signal.signal(signal.SIGALRM, _on_alarm)
+corpus = load_corpus(args.corpus, [g for g in GENERATED if g[0] <= args.max_size], args.seeds)
+images = sorted(glob.glob(os.path.join(ROOT, 'test-images', '*.png')))
+results = []
+groups = [('solve', lambda: bench_solvers(corpus, args.solver or DEFAULT_SOLVERS, args.timeout)),
+          ('board', lambda: bench_boards(corpus, args.repeat)),
+          ('parse_image', lambda: bench_images(images, args.repeat))]
+for group, bench in groups:
+    if group not in args.skip:
+        for result in bench():
+            print_result(result)
+            results.append(result)
+with open(args.output, 'w') as f:
+    json.dump({'metadata': metadata(), 'results': results}, f, indent=1)
@@ -0,0 +1,65 @@
+import collections
+import random
+
+################################################################################
+### generate_puzzle
+################################################################################
+
+def generate_puzzle(rows, cols, colors=3, seed=0, colored=0.6):
+    # Generates a solvable puzzle by laying out random paths, one per color, and
+    # deriving the nodes from them. Interior nodes passed once become colored
+    # nodes (with the given probability), nodes passed several times become
+    # uncolored nodes and untouched nodes go missing.
+    rnd = random.Random(seed)
+    while True:
+        puzzle = _attempt(rnd, rows, cols, colors, colored)
+        if puzzle is not None:
+            return puzzle
+
+def _attempt(rnd, rows, cols, colors, colored):
+    visits = collections.Counter()
+    owners = {}
+    goals = {}
+    used = set() # Occupied edges, including crossing edges.
+    for color in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'[:colors]:
+        free = [(r, c) for r in range(rows) for c in range(cols) if visits[r, c] == 0]
+        if not free:
+            return None
+        path = [rnd.choice(free)]
+        visits[path[0]] += 1
+        length = rnd.randint(2, max(2, 2 * rows * cols // colors))
+        while len(path) < length:
+            options = [n for n in _neighbors(path[-1], rows, cols)
+                       if n not in goals and n != path[0] and visits[n] < 4
+                       and not _edges(path[-1], n) & used]
+            if not options:
+                break
+            node = rnd.choice(options)
+            used |= _edges(path[-1], node)
+            visits[node] += 1
+            owners[node] = color if owners.get(node, color) == color and visits[node] == 1 else None
+            path.append(node)
+        if len(path) < 2 or visits[path[-1]] > 1:
+            return None
+        goals[path[0]] = goals[path[-1]] = color
+    grid = [['0'] * cols for r in range(rows)]
+    for (r, c), count in visits.items():
+        if (r, c) in goals:
+            grid[r][c] = goals[r, c]
+        elif count == 1 and owners[r, c] is not None and rnd.random() < colored:
+            grid[r][c] = owners[r, c].lower()
+        else:
+            grid[r][c] = str(count)
+    return '/'.join(''.join(row) for row in grid)
+
+def _neighbors(node, rows, cols):
+    r, c = node
+    return [(r + i, c + j) for i in (-1, 0, 1) for j in (-1, 0, 1)
+            if (i, j) != (0, 0) and 0 <= r + i < rows and 0 <= c + j < cols]
+
+def _edges(a, b):
+    # The edge between a and b, and the edge it crosses if it is diagonal.
+    edges = {frozenset((a, b))}
+    if a[0] != b[0] and a[1] != b[1]:
+        edges.add(frozenset(((a[0], b[1]), (b[0], a[1]))))
+    return edges
@@ -1,20 +1,69 @@
 #!/usr/bin/env python3
 
 import argparse
+import itertools
+import json
+import signal
 import sys
 import time
 
 from lyner import *
-from lyner.linux import LiveSourceTarget
+
+################################################################################
+### Solver
+################################################################################
+
+def make_solver(args):
+    if args.bidirectional:
+        solver = BidirectionalSolver(max_nodes=args.max_nodes, max_time=args.max_time)
+    else:
+        solver = GuidedDepthFirstSolver(compact=args.compact, prune=args.prune, table_size=args.table_size,
+                                        jobs=args.jobs, max_nodes=args.max_nodes, max_time=args.max_time,
+                                        progress=print_progress if args.progress else None)
+    if args.cache:
+        solver = CachedSolver(solver, args.cache, maxsize=args.cache_size)
+    if args.decompose:
+        solver = DecomposingSolver(solver) # Regions are cached separately.
+    return solver
+
+def print_progress(stats):
+    elapsed = stats.elapsed()
+    print('Expanded {0} nodes in {1:.1f}s ({2:.0f}/s), {3} backtracks, max depth {4}'.format(
+          stats.expanded, elapsed, stats.expanded / elapsed if elapsed else 0, stats.backtracks,
+          stats.max_depth), file=sys.stderr)
+
+def enumerating_solver(solver):
+    if isinstance(solver, DecomposingSolver):
+        raise LynerException('Decomposed puzzles cannot be enumerated or counted')
+    if isinstance(solver, CachedSolver):
+        solver = solver.solver # Only single solutions are cached.
+    if not hasattr(solver, 'count_solutions'):
+        raise LynerException('Only the guided solver can enumerate or count solutions')
+    return solver
 
 ################################################################################
 ### Manual mode
 ################################################################################
 
 def manual_mode(args):
-    solver = GuidedDepthFirstSolver()
+    solver = make_solver(args)
     source = TextSource(args.puzzle) if args.puzzle else ImageSource(args.image)
     target = TextTarget() if args.dont_draw else DrawTarget()
+    if args.all or args.count:
+        solver = enumerating_solver(solver)
+        puzzle = source.get_puzzle()
+        if not puzzle:
+            raise LynerException('Failed to get puzzle')
+        if args.count:
+            count = solver.count_solutions(puzzle, args.limit)
+            if args.limit is not None and count > args.limit:
+                print('Solutions: more than {0}'.format(args.limit))
+            else:
+                print('Solutions: {0}'.format(count))
+        else:
+            for solution in itertools.islice(solver.solutions(puzzle), args.limit):
+                target.put_solution(solution)
+        return
     lyner  = Lyner(source, solver, target)
     lyner.run()
 
@@ -23,20 +72,74 @@ def manual_mode(args):
 ################################################################################
 
 def auto_mode(args):
-    source = LiveSourceTarget()
-    solver = GuidedDepthFirstSolver()
+    from lyner.linux import LiveSourceTarget
+    source = LiveSourceTarget(detect_changes=args.detect_changes, collapse_runs=args.collapse_runs,
+                              move_delay=args.move_delay, button_delay=args.button_delay)
+    solver = make_solver(args)
     target = source if not args.dont_act else TextTarget()
-    lyner = Lyner(source, solver, target)
+    metrics = None
+    if args.metrics or args.profile:
+        metrics = PipelineMetrics(args.metrics, format=args.metrics_format,
+                                  profile=args.profile, profile_path=args.profile_output)
+        source.metrics = metrics
+    lyner = Lyner(source, solver, target, metrics=metrics)
     try:
         while True:
             try:
                 lyner.run()
+                if not args.detect_changes:
+                    time.sleep(2)
             except LynerException as e:
                 print(str(e), file=sys.stderr)
-            time.sleep(2)
+                time.sleep(2)
     except KeyboardInterrupt:
         pass
 
+################################################################################
+### Batch mode
+################################################################################
+
+def batch_mode(args):
+    solver = make_solver(args)
+    if args.count:
+        solver = enumerating_solver(solver)
+    infile = sys.stdin if args.input == '-' else open(args.input)
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w')
+    with infile, outfile:
+        for result in solve_batch(infile, solver, workers=args.workers,
+                                  ordered=not args.unordered, inflight=args.max_inflight,
+                                  count=args.count, limit=args.limit):
+            print(json.dumps(result), file=outfile)
+
+################################################################################
+### Server mode
+################################################################################
+
+def serve_mode(args):
+    from lyner.server import serve
+    solver = make_solver(args)
+    try:
+        counting_solver = enumerating_solver(solver)
+    except LynerException:
+        counting_solver = None # Count requests are answered with an error.
+    # Stop as cleanly on SIGTERM as on Ctrl+C, so the socket is removed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(solver, args.socket, workers=args.workers, counting_solver=counting_solver)
+    except KeyboardInterrupt:
+        pass
+
+def client_mode(args):
+    from lyner.server import request
+    image = None
+    if args.image:
+        with open(args.image, 'rb') as f:
+            image = f.read()
+    result = request(args.socket, puzzle=args.puzzle, image=image, count=args.count, limit=args.limit)
+    print(json.dumps(result))
+    if result['status'] != 'solved':
+        sys.exit(1)
+
 ################################################################################
 ### Arguments
 ################################################################################
@@ -45,17 +148,69 @@ parser = argparse.ArgumentParser()
 mode = parser.add_subparsers(title='mode', dest='mode')
 mode.required = True
 
-manual = mode.add_parser('manual', help='use manual input and produce textual output', description='use manual input and produce textual output')
+solver_options = argparse.ArgumentParser(add_help=False)
+solver_group = solver_options.add_argument_group('solver options')
+solver_group.add_argument('--bidirectional', help='join half-paths grown from both goals of each color; '
+                          'experimental and usually slower (only honours --max-nodes and --max-time)', action='store_true')
+solver_group.add_argument('--compact', help='search on the compact bitset board representation', action='store_true')
+solver_group.add_argument('--prune', help='cut off dead ends by reachability and capacity checks', action='store_true')
+solver_group.add_argument('--table-size', help='remember up to N search states known to be unsolvable', metavar='N', type=int, default=0)
+solver_group.add_argument('-j', '--jobs', help='search in parallel using N worker processes', metavar='N', type=int, default=1)
+solver_group.add_argument('--max-nodes', help='give up after expanding N nodes', metavar='N', type=int)
+solver_group.add_argument('--max-time', help='give up after N seconds', metavar='N', type=float)
+solver_group.add_argument('--progress', help='report search progress periodically', action='store_true')
+solver_group.add_argument('--decompose', help='split the puzzle into regions that are solved independently', action='store_true')
+solver_group.add_argument('--cache', help='reuse solutions stored in a cache file', metavar='FILE')
+solver_group.add_argument('--cache-size', help='keep at most N cached solutions', metavar='N', type=int, default=100000)
+
+manual = mode.add_parser('manual', help='use manual input and produce textual output', description='use manual input and produce textual output', parents=[solver_options])
 manual.add_argument('--dont-draw', help='present the solution in raw textual form', action='store_true')
+manual.add_argument('--all', help='present every solution (up to --limit)', action='store_true')
+manual.add_argument('--count', help='count the solutions instead (up to --limit)', action='store_true')
+manual.add_argument('--limit', help='stop after N solutions, or once more than N are counted', metavar='N', type=int)
 inputs = manual.add_argument_group('input method').add_mutually_exclusive_group(required=True)
 inputs.add_argument('puzzle', help='read the puzzle from a textual representation', nargs='?')
 inputs.add_argument('-i', '--image', help='read the puzzle from a saved image file')
 manual.set_defaults(func=manual_mode)
 
-auto = mode.add_parser('auto', help='solve live LYNE puzzles automatically', description='solve live LYNE puzzles automatically')
+auto = mode.add_parser('auto', help='solve live LYNE puzzles automatically', description='solve live LYNE puzzles automatically', parents=[solver_options])
 auto.add_argument('--dont-act', help='print the solution instead of acting it out', action='store_true')
+auto.add_argument('--detect-changes', help='poll for the next puzzle by watching the node centers of the last one', action='store_true')
+auto.add_argument('--collapse-runs', help='drag straight across runs of nodes in a line instead of visiting each node', action='store_true')
+auto.add_argument('--move-delay', help='wait N seconds after each mouse move (default: 0.017)', metavar='N', type=float, default=0.017)
+auto.add_argument('--button-delay', help='wait N seconds after each mouse button event (default: 0.025)', metavar='N', type=float, default=0.025)
+auto.add_argument('--metrics', help='write timings and counters of the pipeline stages to a file after every puzzle', metavar='FILE')
+auto.add_argument('--metrics-format', help='append JSON lines, or replace the file with Prometheus text (default: json)',
+                  choices=('json', 'prometheus'), default='json')
+auto.add_argument('--profile', help='run a stage under cProfile', metavar='STAGE',
+                  choices=('get_puzzle', 'wait_for_change', 'capture', 'parse_image', 'solve_puzzle', 'put_solution', 'replay'))
+auto.add_argument('--profile-output', help='write the profile to a file (default: lyner.prof)', metavar='FILE', default='lyner.prof')
 auto.set_defaults(func=auto_mode)
 
+batch = mode.add_parser('batch', help='solve a stream of puzzles and produce JSON lines', description='solve a stream of puzzles, given as text or image paths one per line, and produce one JSON line per puzzle', parents=[solver_options])
+batch.add_argument('input', help='read puzzles from a file (default: standard input)', nargs='?', default='-')
+batch.add_argument('-o', '--output', help='write results to a file (default: standard output)', default='-')
+batch.add_argument('-w', '--workers', help='solve N puzzles concurrently in worker processes', metavar='N', type=int, default=1)
+batch.add_argument('--max-inflight', help='hold at most N unfinished puzzles (default: 4 per worker)', metavar='N', type=int)
+batch.add_argument('--unordered', help='write results in order of completion rather than input order', action='store_true')
+batch.add_argument('--count', help='count the solutions of each puzzle instead of solving it', action='store_true')
+batch.add_argument('--limit', help='stop counting once more than N solutions are found', metavar='N', type=int)
+batch.set_defaults(func=batch_mode)
+
+serve = mode.add_parser('serve', help='keep solving puzzles sent to a local socket', description='keep solving puzzles sent by clients to a Unix domain socket, as JSON lines', parents=[solver_options])
+serve.add_argument('--socket', help='listen on a socket file (default: lyner-UID.sock in the runtime directory)')
+serve.add_argument('-w', '--workers', help='solve N puzzles concurrently in worker processes', metavar='N', type=int, default=1)
+serve.set_defaults(func=serve_mode)
+
+client = mode.add_parser('client', help='send a puzzle to a running server', description='send a puzzle to a running server and print its JSON response')
+client.add_argument('--socket', help='connect to a socket file (default: lyner-UID.sock in the runtime directory)')
+client.add_argument('--count', help='count the solutions instead of solving the puzzle', action='store_true')
+client.add_argument('--limit', help='stop counting once more than N solutions are found', metavar='N', type=int)
+inputs = client.add_argument_group('input method').add_mutually_exclusive_group(required=True)
+inputs.add_argument('puzzle', help='send the puzzle in its textual representation', nargs='?')
+inputs.add_argument('-i', '--image', help='send a saved image file')
+client.set_defaults(func=client_mode)
+
 args = parser.parse_args()
 
 try:
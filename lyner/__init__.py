@@ -1,4 +1,8 @@
-from .base import Lyner, Source, Solver, Target, LynerException
-from .solvers import GuidedDepthFirstSolver
+from .base import Lyner, Source, Solver, Target, LynerException, SearchBudgetExceeded
+from .solvers import GuidedDepthFirstSolver, BidirectionalSolver, SearchStats, SearchTask
 from .sources import TextSource, ImageSource
 from .targets import TextTarget, DrawTarget
+from .cache import CachedSolver
+from .decompose import DecomposingSolver
+from .batch import solve_batch
+from .metrics import PipelineMetrics
@@ -4,12 +4,15 @@
 
 class Lyner:
 
-    def __init__(self, source, solver, target):
+    def __init__(self, source, solver, target, metrics=None):
         self.source = source
         self.solver = solver
         self.target = target
+        self.metrics = metrics # A PipelineMetrics, if the stages should be timed.
 
     def run(self):
+        if self.metrics is not None:
+            return self._run_measured()
         puzzle = self.source.get_puzzle()
         if not puzzle:
             raise LynerException('Failed to get puzzle')
@@ -18,6 +21,26 @@ class Lyner:
             raise LynerException('Failed to solve puzzle')
         self.target.put_solution(solution)
 
+    def _run_measured(self):
+        # As run, but with each stage timed.
+        metrics = self.metrics
+        metrics.start_run()
+        try:
+            with metrics.stage('get_puzzle'):
+                puzzle = self.source.get_puzzle()
+                if not puzzle:
+                    raise LynerException('Failed to get puzzle')
+            with metrics.stage('solve_puzzle'):
+                solution = self.solver.solve_puzzle(puzzle)
+                if not solution:
+                    raise LynerException('Failed to solve puzzle')
+            with metrics.stage('put_solution'):
+                self.target.put_solution(solution)
+        except Exception as e:
+            metrics.end_run(e)
+            raise
+        metrics.end_run()
+
 ################################################################################
 ### Source
 ################################################################################
@@ -51,3 +74,6 @@ class Target:
 
 class LynerException(Exception):
     pass
+
+class SearchBudgetExceeded(LynerException):
+    pass
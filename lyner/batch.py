@@ -0,0 +1,80 @@
+import collections
+import os
+import time
+
+from .base import LynerException
+from .sources import TextSource, ImageSource
+
+################################################################################
+### solve_batch
+################################################################################
+
+def solve_batch(lines, solver, workers=1, ordered=True, inflight=None, count=False, limit=None):
+    # Solves a stream of puzzles, given as text or image paths, and yields one
+    # result per puzzle. At most `inflight` puzzles are held at any time. With
+    # `count`, the solutions are counted (up to `limit` + 1) instead.
+    inputs = ((index, line.strip()) for index, line in enumerate(lines) if line.strip())
+    if workers <= 1:
+        _init_worker(solver)
+        for index, line in inputs:
+            yield _solve_line(index, line, count, limit)
+        return
+    import concurrent.futures
+    inflight = inflight or workers * 4
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(solver,)) as pool:
+        if ordered:
+            futures = collections.deque()
+            for index, line in inputs:
+                if len(futures) >= inflight:
+                    yield futures.popleft().result()
+                futures.append(pool.submit(_solve_line, index, line, count, limit))
+            while futures:
+                yield futures.popleft().result()
+        else:
+            futures = set()
+            for index, line in inputs:
+                if len(futures) >= inflight:
+                    done, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                futures.add(pool.submit(_solve_line, index, line, count, limit))
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+
+_solver = None          # The solver used by the current worker process.
+_counting_solver = None # The solver used to count solutions, often the same.
+
+def _init_worker(solver, counting_solver=None):
+    global _solver, _counting_solver
+    _solver = solver
+    _counting_solver = counting_solver if counting_solver is not None else solver
+
+def _solve_line(index, line, count=False, limit=None):
+    source = ImageSource(line) if os.path.isfile(line) else TextSource(line)
+    return _solve_source({'index': index, 'input': line}, source, count, limit)
+
+def _solve_source(result, source, count=False, limit=None):
+    result.update(puzzle=None, status=None, solution=None)
+    start = time.perf_counter()
+    try:
+        result['puzzle'] = source.get_puzzle()
+        parsed = time.perf_counter()
+        result['parse_time'] = parsed - start
+        try:
+            if count:
+                if not hasattr(_counting_solver, 'count_solutions'):
+                    raise LynerException('The solver cannot count solutions')
+                result['count'] = _counting_solver.count_solutions(result['puzzle'], limit)
+                result['status'] = 'solved' if result['count'] else 'failed'
+            else:
+                result['solution'] = _solver.solve_puzzle(result['puzzle'])
+                result['status'] = 'solved'
+        except LynerException as e:
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        result['solve_time'] = time.perf_counter() - parsed
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['time'] = time.perf_counter() - start
+    return result
@@ -0,0 +1,108 @@
+import json
+import os
+import sqlite3
+import threading
+
+from .base import Solver
+
+################################################################################
+### CachedSolver
+################################################################################
+
+class CachedSolver(Solver):
+
+    def __init__(self, solver, path, maxsize=100000):
+        self.solver = solver
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect()
+
+    def __getstate__(self):
+        # Connections cannot be shared with other processes; they reconnect.
+        state = self.__dict__.copy()
+        del state['lock'], state['db']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._connect()
+
+    def _connect(self):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS solutions ('
+                        'puzzle TEXT PRIMARY KEY, solution TEXT NOT NULL, used INTEGER NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)')
+        self.db.commit()
+        self.clock = self.db.execute('SELECT COALESCE(MAX(used), 0) FROM solutions').fetchone()[0]
+
+    def solve_puzzle(self, puzzle):
+        canonical, forward, backward = canonicalize(puzzle)
+        with self.lock:
+            self.clock += 1
+            row = self.db.execute('SELECT solution FROM solutions WHERE puzzle = ?', (canonical,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                self.db.execute('UPDATE solutions SET used = ? WHERE puzzle = ?', (self.clock, canonical))
+                self.db.commit()
+                return _map_solution(json.loads(row[0]), backward)
+            self.misses += 1
+        solution = self.solver.solve_puzzle(puzzle)
+        with self.lock:
+            self.clock += 1
+            self.db.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)',
+                            (canonical, json.dumps(_map_solution(solution, forward)), self.clock))
+            # Evict the least recently used entries beyond the size limit.
+            count = self.db.execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+            if count > self.maxsize:
+                self.db.execute('DELETE FROM solutions WHERE puzzle IN '
+                                '(SELECT puzzle FROM solutions ORDER BY used LIMIT ?)', (count - self.maxsize,))
+                self.evictions += count - self.maxsize
+            self.db.commit()
+        return solution
+
+    def close(self):
+        self.db.close()
+
+def _map_solution(solution, mapping):
+    return [[mapping[tuple(position)] for position in path] for path in solution]
+
+################################################################################
+### canonicalize
+################################################################################
+
+_SYMMETRIES = [lambda r, c, rows, cols: (r, c),                       # Identity
+               lambda r, c, rows, cols: (c, rows - 1 - r),            # Rotate 90
+               lambda r, c, rows, cols: (rows - 1 - r, cols - 1 - c), # Rotate 180
+               lambda r, c, rows, cols: (cols - 1 - c, r),            # Rotate 270
+               lambda r, c, rows, cols: (r, cols - 1 - c),            # Mirror
+               lambda r, c, rows, cols: (rows - 1 - r, c),            # Flip
+               lambda r, c, rows, cols: (c, r),                       # Transpose
+               lambda r, c, rows, cols: (cols - 1 - c, rows - 1 - r)] # Anti-transpose
+
+def canonicalize(puzzle):
+    # Returns the canonical form of the puzzle under the grid symmetries, along
+    # with the position mappings to and from the canonical form.
+    grid = puzzle.split('/')
+    rows, cols = len(grid), len(grid[0])
+    identity = {(r, c): (r, c) for r in range(rows) for c in range(len(grid[r]))}
+    if any(len(row) != cols for row in grid):
+        return puzzle, identity, identity # Only rectangular grids are transformed.
+    best = None
+    for symmetry in _SYMMETRIES:
+        forward = {(r, c): symmetry(r, c, rows, cols) for r, c in identity}
+        symbols = {position: grid[r][c] for (r, c), position in forward.items()}
+        height = 1 + max(r for r, c in symbols)
+        width = 1 + max(c for r, c in symbols)
+        transformed = '/'.join(''.join(symbols[r, c] for c in range(width)) for r in range(height))
+        if best is None or transformed < best[0]:
+            best = (transformed, forward)
+    canonical, forward = best
+    backward = {position: original for original, position in forward.items()}
+    return canonical, forward, backward
@@ -0,0 +1,209 @@
+import collections
+
+from .base import Solver, LynerException
+from .utility import Board
+
+################################################################################
+### DecomposingSolver
+################################################################################
+
+class DecomposingSolver(Solver):
+
+    def __init__(self, solver, workers=1):
+        self.solver = solver
+        self.workers = workers
+
+    def solve_puzzle(self, puzzle):
+        regions = decompose(puzzle)
+        puzzles = [region for region, offset in regions]
+        if self.workers > 1 and len(regions) > 1:
+            import concurrent.futures
+            with concurrent.futures.ProcessPoolExecutor(min(self.workers, len(regions))) as pool:
+                solutions = list(pool.map(self.solver.solve_puzzle, puzzles))
+        else:
+            solutions = [self.solver.solve_puzzle(region) for region in puzzles]
+        # Stitch the partial solutions back together.
+        return [[(i + top, j + left) for i, j in path]
+                for (region, (top, left)), solution in zip(regions, solutions) for path in solution]
+
+################################################################################
+### decompose
+################################################################################
+
+def decompose(puzzle):
+    # Splits the puzzle into regions that can be solved independently, and
+    # returns them as (puzzle, (top, left)) pairs, where (top, left) is the
+    # position of the region's puzzle within the original one. Raises a
+    # LynerException if the puzzle is found to be unsolvable on the way.
+    board = Board(puzzle)
+    nodes = [node for node in board.nodes if node.capacity > 0]
+    edges = [edge for edge in board.edges if _usable(edge)]
+    _check_degrees(nodes, edges)
+    # Drop the bridges that no path can cross. A path that crosses a bridge
+    # can't come back, so only a color with one goal on either side may use it.
+    search = _DepthFirstSearch(nodes, edges)
+    goals = _goals(nodes)
+    dropped = set()
+    for node, edge in search.bridges():
+        split = [nodetype for nodetype, (a, b) in goals.items()
+                 if search.below(a, node) != search.below(b, node)]
+        if len(split) > 1:
+            raise LynerException('Failed to solve puzzle (colors {0} must share a single edge)'.format(
+                                 ', '.join(sorted(split))))
+        if not split:
+            dropped.add(edge)
+    # Paths can't pass a cut node more often than its capacity allows.
+    for node, pieces in search.cut_nodes():
+        _check_cut_node(node, pieces, goals, search)
+    edges = [edge for edge in edges if edge not in dropped]
+    # Nodes connected by usable edges, or with crossing usable edges, belong to
+    # the same region.
+    parent = {node: node for node in nodes}
+    def find(node):
+        while parent[node] is not node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+    usable = set(edges)
+    for edge in edges:
+        parent[find(edge.a)] = find(edge.b)
+        if edge.crosses in usable:
+            parent[find(edge.a)] = find(edge.crosses.a)
+    regions = collections.OrderedDict()
+    for node in nodes:
+        regions.setdefault(find(node), []).append(node)
+    totals = collections.Counter(node.nodetype for node in nodes if node.goal)
+    for region in regions.values():
+        _check_region(region, totals)
+    if len(regions) == 1:
+        return [(puzzle, (0, 0))]
+    return [_extract(region) for region in regions.values()]
+
+def _usable(edge):
+    # Whether any path could use the edge.
+    a, b = edge.a, edge.b
+    if a.capacity == 0 or b.capacity == 0:
+        return False
+    return a.neutral or b.neutral or a.nodetype == b.nodetype
+
+def _goals(nodes):
+    # The goal pairs by type. Malformed colors are left to the solver.
+    goals = collections.defaultdict(list)
+    for node in nodes:
+        if node.goal:
+            goals[node.nodetype].append(node)
+    return {nodetype: pair for nodetype, pair in goals.items() if len(pair) == 2}
+
+def _check_degrees(nodes, edges):
+    degree = collections.Counter()
+    for edge in edges:
+        degree[edge.a] += 1
+        degree[edge.b] += 1
+    for node in nodes:
+        if degree[node] < (1 if node.goal else 2 * node.capacity):
+            raise LynerException('Failed to solve puzzle (node {0} has too few edges)'.format(node.position))
+
+def _check_cut_node(node, pieces, goals, search):
+    # Every color with goals in different pieces of the graph without the node
+    # has to pass through it, as does a path into every piece without goals.
+    def piece(other):
+        return next((child for child in pieces if search.below(other, child)), None)
+    visits = 1 if node.goal else 0
+    for nodetype, (a, b) in goals.items():
+        if node is not a and node is not b and piece(a) != piece(b):
+            if not node.neutral and nodetype != node.nodetype:
+                visits = node.capacity # Can't pass through at all.
+            visits += 1
+    goal_pieces = {piece(goal) for pair in goals.values() for goal in pair}
+    visits += sum(1 for child in pieces if child not in goal_pieces)
+    if visits > node.capacity:
+        raise LynerException('Failed to solve puzzle (node {0} is passed too often)'.format(node.position))
+
+def _check_region(region, totals):
+    # Each color in a region must have all of its goals there.
+    goals = collections.Counter(node.nodetype for node in region if node.goal)
+    if not goals:
+        raise LynerException('Failed to solve puzzle (nodes around {0} are unreachable)'.format(region[0].position))
+    for node in region:
+        if not node.neutral and goals[node.nodetype] != totals[node.nodetype]:
+            raise LynerException('Failed to solve puzzle (node {0} is cut off from its goals)'.format(node.position))
+
+def _extract(region):
+    top = min(node.position[0] for node in region)
+    left = min(node.position[1] for node in region)
+    bottom = max(node.position[0] for node in region)
+    right = max(node.position[1] for node in region)
+    symbols = {node.position: node.symbol for node in region}
+    puzzle = '/'.join(''.join(symbols.get((i, j), '0') for j in range(left, right + 1))
+                      for i in range(top, bottom + 1))
+    return puzzle, (top, left)
+
+################################################################################
+### _DepthFirstSearch
+################################################################################
+
+class _DepthFirstSearch:
+
+    # A depth-first search over the usable edges, which finds the bridges and
+    # cut nodes of the graph. Nodes are numbered in the order in which they are
+    # discovered, so the nodes below a node are those numbered from its own
+    # number up to the highest number below it.
+
+    def __init__(self, nodes, edges):
+        links = {node: [] for node in nodes}
+        for edge in edges:
+            links[edge.a].append((edge, edge.b))
+            links[edge.b].append((edge, edge.a))
+        self.number = {}  # Discovery order.
+        self.low = {}     # Lowest number reachable through one edge off the subtree.
+        self.last = {}    # Highest number below the node.
+        self.parent = {}  # The edge leading to the node.
+        self.children = collections.defaultdict(list)
+        for root in nodes:
+            if root in self.number:
+                continue
+            self.parent[root] = None
+            self._discover(root)
+            stack = [(root, iter(links[root]))]
+            while stack:
+                node, remaining = stack[-1]
+                for edge, other in remaining:
+                    if edge is self.parent[node]:
+                        continue
+                    if other not in self.number:
+                        self.parent[other] = edge
+                        self.children[node].append(other)
+                        self._discover(other)
+                        stack.append((other, iter(links[other])))
+                        break
+                    self.low[node] = min(self.low[node], self.number[other])
+                else:
+                    stack.pop()
+                    self.last[node] = len(self.number) - 1
+                    if stack:
+                        above = stack[-1][0]
+                        self.low[above] = min(self.low[above], self.low[node])
+
+    def _discover(self, node):
+        self.number[node] = self.low[node] = len(self.number)
+
+    def below(self, node, ancestor):
+        return self.number[ancestor] <= self.number[node] <= self.last[ancestor]
+
+    def bridges(self):
+        # Yields (node, edge) for each bridge, where the edge leads to the node.
+        for node, edge in self.parent.items():
+            if edge is not None:
+                above = edge.a if edge.b is node else edge.b
+                if self.low[node] > self.number[above]:
+                    yield node, edge
+
+    def cut_nodes(self):
+        # Yields (node, children) for each cut node, along with the children
+        # whose subtrees are cut off from the rest of the graph by it.
+        for node, children in self.children.items():
+            pieces = [child for child in children if self.low[child] >= self.number[node]]
+            if self.parent[node] is None and len(children) < 2:
+                continue # A root is only a cut node with several subtrees.
+            if pieces:
+                yield node, pieces
@@ -1,11 +1,22 @@
+import errno
 import os
 import subprocess
 import sys
-import tempfile
 import time
 
 from .base import Source, Target, LynerException
-from .utility import parse_image
+from .metrics import measure
+from .utility import parse_image, plan_replay, ppm_header
+
+_POLL_MIN = 0.05      # Seconds between screenshots while waiting for a change.
+_POLL_MAX = 1.0
+_UNCHANGED_MAX = 10.0 # Seconds before re-parsing an unchanged screen anyway.
+_STEP_DELAY = 0.025   # Seconds for the game to register each single mouse event.
+_MOVE_DELAY = 0.017   # Seconds after each move in a batch, one frame at 60 fps.
+_BUTTON_DELAY = 0.025 # Seconds after each button event in a batch.
+
+# The input driver. May be replaced by a stand-in that records its commands.
+_XDOTOOL = os.environ.get('LYNER_XDOTOOL', 'xdotool')
 
 ################################################################################
 ### LiveSourceTarget
@@ -13,10 +24,11 @@ from .utility import parse_image
 
 class LiveSourceTarget(Source, Target):
 
-    def __init__(self):
+    def __init__(self, detect_changes=False, collapse_runs=False,
+                 move_delay=_MOVE_DELAY, button_delay=_BUTTON_DELAY):
         if not sys.platform.startswith('linux'):
             raise Exception('Unsupported platform')
-        for p in ('timeout', 'import', 'xdotool'):
+        for p in ('timeout', 'import', _XDOTOOL):
             if not _program_exists(p):
                 raise Exception('LiveSourceTarget requires the program "{0}"'.format(p))
         try:
@@ -25,37 +37,105 @@ class LiveSourceTarget(Source, Target):
             raise LynerException('Failed to find LYNE window')
         self.row_coords = None
         self.col_coords = None
+        self.detect_changes = detect_changes
+        self.collapse_runs = collapse_runs
+        self.move_delay = move_delay     # Seconds for the game to register a move.
+        self.button_delay = button_delay # Seconds for the game to register a button event.
+        self.signature = None # Node pixels of the last parsed puzzle.
+        self.metrics = None   # A PipelineMetrics to report finer stages to, if any.
 
     def get_puzzle(self):
         try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                imagefile = tmpdir + '/screenshot.png'
-                puzzle = None
-                while not puzzle:
+            puzzle = None
+            frame = None # A fresh screenshot, as PPM data.
+            if self.detect_changes and self.signature is not None:
+                with measure(self.metrics, 'wait_for_change'):
+                    frame = self._wait_for_change()
+            while not puzzle:
+                if frame is None:
                     _wait_until_active(self.window)
-                    res = subprocess.run(['timeout', '1', 'import', '-screen', '-window', 'LYNE', imagefile],
-                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-                    puzzle, self.row_coords, self.col_coords = parse_image(imagefile, return_coords=True)
-                    if not puzzle:
-                        print('Failed to find puzzle')
-                        time.sleep(2)
-                print('Puzzle:', puzzle)
-                return puzzle
+                    with measure(self.metrics, 'capture'):
+                        frame = _screenshot()
+                with measure(self.metrics, 'parse_image'):
+                    puzzle, self.row_coords, self.col_coords = parse_image(frame, return_coords=True)
+                if not puzzle:
+                    frame = None
+                    print('Failed to find puzzle')
+                    if self.metrics is not None:
+                        self.metrics.increment('parse retries')
+                    time.sleep(_POLL_MAX if self.detect_changes else 2)
+            if self.detect_changes:
+                self.signature = self._sample(frame)
+            print('Puzzle:', puzzle)
+            return puzzle
         except subprocess.CalledProcessError:
             raise LynerException('Failed to take screenshot')
 
+    def _wait_for_change(self):
+        # Polls the node pixels of the last puzzle until they differ from the
+        # last parsed frame and have settled, backing off while nothing happens.
+        # Returns the settled frame, if any.
+        interval, since, last = _POLL_MIN, time.monotonic(), self.signature
+        while time.monotonic() - since < _UNCHANGED_MAX:
+            _wait_until_active(self.window)
+            frame = _screenshot()
+            signature = self._sample(frame)
+            if signature != self.signature and signature == last:
+                return frame # Changed, and identical to the previous frame.
+            if signature != last:
+                interval = _POLL_MIN # Something is moving; look again soon.
+            else:
+                interval = min(interval * 2, _POLL_MAX)
+            last = signature
+            time.sleep(interval)
+        return None
+
+    def _sample(self, frame):
+        # Reads the pixels at the node centers and at the holes of neutral
+        # nodes straight from the PPM data. The holes lie on the axes through
+        # the center, at about an eighth of the grid spacing.
+        width, height, offset = ppm_header(frame)
+        d = _hole_offset(self.row_coords, self.col_coords)
+        points = ((0, 0), (0, -d), (0, d), (-d, 0), (d, 0)) # Center, up, down, left, right.
+        return tuple(frame[offset + 3 * (y * width + x):offset + 3 * (y * width + x) + 3]
+                     if 0 <= x < width and 0 <= y < height else None
+                     for cy in self.row_coords for cx in self.col_coords
+                     for x, y in ((cx + dx, cy + dy) for dx, dy in points))
+
     def put_solution(self, solution):
         print('Solution:', solution)
         _wait_until_active(self.window)
-        for path in solution:
+        try:
+            with measure(self.metrics, 'replay'):
+                self._batch(solution).run()
+        except subprocess.CalledProcessError:
+            raise LynerException('Failed to act out solution')
+
+    def _batch(self, solution):
+        batch = self.window.batch(self.move_delay, self.button_delay)
+        for path in plan_replay(solution, collapse=self.collapse_runs):
             row, col = path[0]
             x, y = self.col_coords[col], self.row_coords[row]
-            self.window.mousemove(x, y)
-            self.window.mousedown()
+            batch.mousemove(x, y)
+            batch.mousedown()
             for row, col in path[1:]:
                 x, y = self.col_coords[col], self.row_coords[row]
-                self.window.mousemove(x, y)
-            self.window.mouseup()
+                batch.mousemove(x, y)
+            batch.mouseup()
+        return batch
+
+_SCREENSHOT = ['timeout', '1', 'import', '-screen', '-window', 'LYNE', '-depth', '8', 'ppm:-']
+
+def _screenshot():
+    # Captures the window as uncompressed PPM data, without touching the disk.
+    res = subprocess.run(_SCREENSHOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return res.stdout
+
+def _hole_offset(row_coords, col_coords):
+    # Returns the distance from a node center to its holes, derived from the
+    # smallest distance between neighbouring rows or columns.
+    gaps = [b - a for c in (row_coords, col_coords) for a, b in zip(c, c[1:])]
+    return max(1, min(gaps) // 8) if gaps else 1
 
 def _wait_until_active(wnd):
     if not wnd.is_active():
@@ -68,7 +148,7 @@ def _program_exists(name):
         subprocess.run([name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         return True
     except OSError as e:
-        return e.errno != os.errno.ENOENT
+        return e.errno != errno.ENOENT
 
 ################################################################################
 ### _XWindow
@@ -80,16 +160,19 @@ class _XWindow:
         self.id = id
 
     def activate(self):
-        return _action('xdotool windowactivate {0}'.format(self.id))
+        return _action('windowactivate {0}'.format(self.id))
 
     def mousemove(self, x, y):
-        return _action('xdotool mousemove --window {0} {1} {2}'.format(self.id, x, y))
+        return _action('mousemove --window {0} {1} {2}'.format(self.id, x, y))
 
     def mousedown(self):
-        return _action('xdotool mousedown 1')
+        return _action('mousedown 1')
 
     def mouseup(self):
-        return _action('xdotool mouseup 1')
+        return _action('mouseup 1')
+
+    def batch(self, move_delay=_MOVE_DELAY, button_delay=_BUTTON_DELAY):
+        return _XBatch(self, move_delay, button_delay)
 
     def is_active(self):
         try:
@@ -99,17 +182,58 @@ class _XWindow:
 
     @classmethod
     def search(clazz, name):
-        res = _action('xdotool search --name ^{0}$'.format(name), delay=0)
+        res = _action('search --name ^{0}$'.format(name), delay=0)
         id = str(res.stdout, 'utf-8').strip()
         return clazz(id)
 
     @classmethod
     def getactivewindow(clazz):
-        res = _action('xdotool getactivewindow', delay=0)
+        res = _action('getactivewindow', delay=0)
         id = str(res.stdout, 'utf-8').strip()
         return clazz(id)
 
-def _action(cmd, delay=0.025):
-    res = subprocess.run(cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+def _action(cmd, delay=_STEP_DELAY):
+    res = subprocess.run([_XDOTOOL] + cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
     time.sleep(delay)
     return res
+
+################################################################################
+### _XBatch
+################################################################################
+
+class _XBatch:
+
+    # Collects mouse events and sends them to a single xdotool process as a
+    # script, which paces them itself. Moves and button events are followed
+    # by their own delays.
+
+    def __init__(self, window, move_delay=_MOVE_DELAY, button_delay=_BUTTON_DELAY):
+        self.window = window
+        self.move_delay = move_delay
+        self.button_delay = button_delay
+        self.commands = []
+
+    def mousemove(self, x, y):
+        self._add('mousemove --window {0} {1} {2}'.format(self.window.id, x, y), self.move_delay)
+
+    def mousedown(self):
+        self._add('mousedown 1', self.button_delay)
+
+    def mouseup(self):
+        self._add('mouseup 1', self.button_delay)
+
+    def run(self):
+        return subprocess.run([_XDOTOOL, '-'], input=self._script(),
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+    def _script(self):
+        if self.commands and self.commands[-1].startswith('sleep'):
+            self.commands.pop() # Nothing follows that needs to wait.
+        script = ''.join(command + '\n' for command in self.commands)
+        self.commands = []
+        return script.encode('utf-8')
+
+    def _add(self, command, delay):
+        self.commands.append(command)
+        if delay:
+            self.commands.append('sleep {0}'.format(delay))
@@ -0,0 +1,181 @@
+import bisect
+import collections
+import contextlib
+import itertools
+import json
+import os
+import time
+
+# Upper bounds of the latency histogram buckets, in seconds.
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+_NOT_MEASURED = contextlib.nullcontext()
+
+################################################################################
+### PipelineMetrics
+################################################################################
+
+class PipelineMetrics:
+
+    # Times the stages of a pipeline (getting, solving and acting out puzzles,
+    # and any finer stages that sources and targets report) and counts runs,
+    # failures and retries. Latency quantiles and histograms are kept over the
+    # last `window` timings of each stage. After each run, a record is appended
+    # to `path` as a JSON line, or with format 'prometheus', the file is
+    # replaced by the current metrics in the Prometheus text format. With
+    # profile, the named stage runs under cProfile, and the accumulated
+    # profile is written to profile_path after each run.
+
+    def __init__(self, path=None, format='json', window=1000, profile=None, profile_path='lyner.prof'):
+        if format not in ('json', 'prometheus'):
+            raise ValueError('Unknown metrics format: {0}'.format(format))
+        self.path = path
+        self.format = format
+        self.window = window
+        self.stages = collections.OrderedDict()   # Name -> _StageMetrics.
+        self.counters = collections.Counter()     # Runs, failures, retries and other events.
+        self.current = collections.OrderedDict()  # Seconds per stage of the current run.
+        self.profile = profile
+        self.profile_path = profile_path
+        self.profiler = None
+        if profile is not None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+        self._failed_last = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # Times the enclosed block as the named stage. Exceptions count as
+        # failures of the stage and are passed on.
+        profiling = self.profiler is not None and name == self.profile
+        if profiling:
+            self.profiler.enable()
+        start = time.monotonic()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            elapsed = time.monotonic() - start
+            if profiling:
+                self.profiler.disable()
+            self._stage(name).add(elapsed, failed)
+            self.current[name] = self.current.get(name, 0) + elapsed
+
+    def increment(self, name, n=1):
+        self.counters[name] += n
+
+    def start_run(self):
+        self.current.clear()
+        self.counters['runs'] += 1
+        if self._failed_last:
+            self.counters['retries'] += 1
+
+    def end_run(self, error=None):
+        self._failed_last = error is not None
+        if error is not None:
+            self.counters['failures'] += 1
+        if self.path is not None:
+            self.write(error)
+        if self.profiler is not None:
+            self.profiler.dump_stats(self.profile_path)
+
+    def as_dict(self):
+        return {'counters': dict(self.counters),
+                'stages': {name: stage.as_dict() for name, stage in self.stages.items()}}
+
+    def write(self, error=None):
+        if self.format == 'json':
+            record = {'time': time.time(), 'status': 'failed' if error is not None else 'ok',
+                      'run': dict(self.current)}
+            if error is not None:
+                record['error'] = str(error)
+            record.update(self.as_dict())
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        else:
+            # Replaced atomically, so that a collector never reads half a file.
+            temporary = self.path + '.tmp'
+            with open(temporary, 'w') as f:
+                f.write(self.prometheus())
+            os.replace(temporary, self.path)
+
+    def prometheus(self):
+        lines = []
+        def metric(name, kind, help):
+            lines.append('# HELP lyner_{0} {1}'.format(name, help))
+            lines.append('# TYPE lyner_{0} {1}'.format(name, kind))
+        for name in ('runs', 'failures', 'retries'):
+            metric('{0}_total'.format(name), 'counter', 'Pipeline {0}.'.format(name))
+            lines.append('lyner_{0}_total {1}'.format(name, self.counters[name]))
+        metric('events_total', 'counter', 'Other pipeline events.')
+        for name, value in sorted(self.counters.items()):
+            if name not in ('runs', 'failures', 'retries'):
+                lines.append('lyner_events_total{{event="{0}"}} {1}'.format(name, value))
+        metric('stage_failures_total', 'counter', 'Failures per stage.')
+        for name, stage in self.stages.items():
+            lines.append('lyner_stage_failures_total{{stage="{0}"}} {1}'.format(name, stage.failures))
+        metric('stage_seconds', 'histogram', 'Seconds spent per stage.')
+        for name, stage in self.stages.items():
+            for bound, count in zip(_BUCKETS, itertools.accumulate(stage.buckets)):
+                lines.append('lyner_stage_seconds_bucket{{stage="{0}",le="{1}"}} {2}'.format(
+                             name, '+Inf' if bound == float('inf') else bound, count))
+            lines.append('lyner_stage_seconds_sum{{stage="{0}"}} {1}'.format(name, stage.total))
+            lines.append('lyner_stage_seconds_count{{stage="{0}"}} {1}'.format(name, stage.count))
+        metric('stage_recent_seconds', 'gauge', 'Quantiles of the recent seconds spent per stage.')
+        for name, stage in self.stages.items():
+            for quantile, value in stage.quantiles().items():
+                lines.append('lyner_stage_recent_seconds{{stage="{0}",quantile="{1}"}} {2}'.format(
+                             name, quantile, value))
+        return ''.join(line + '\n' for line in lines)
+
+    def _stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = _StageMetrics(self.window)
+        return stage
+
+def measure(metrics, name):
+    # Times the enclosed block as a stage of metrics, if there are any.
+    return metrics.stage(name) if metrics is not None else _NOT_MEASURED
+
+################################################################################
+### _StageMetrics
+################################################################################
+
+class _StageMetrics:
+
+    def __init__(self, window):
+        self.count = 0
+        self.failures = 0
+        self.total = 0.0
+        self.last = None
+        self.buckets = [0] * len(_BUCKETS) # Since the start, not cumulative.
+        self.recent = collections.deque(maxlen=window)
+
+    def add(self, elapsed, failed=False):
+        self.count += 1
+        self.failures += failed
+        self.total += elapsed
+        self.last = elapsed
+        self.buckets[bisect.bisect_left(_BUCKETS, elapsed)] += 1
+        self.recent.append(elapsed)
+
+    def quantiles(self):
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in (0.5, 0.9, 0.99)}
+
+    def histogram(self):
+        # The recent timings per bucket, by upper bound.
+        counts = [0] * len(_BUCKETS)
+        for elapsed in self.recent:
+            counts[bisect.bisect_left(_BUCKETS, elapsed)] += 1
+        return {('+Inf' if bound == float('inf') else str(bound)): count
+                for bound, count in zip(_BUCKETS, counts) if count}
+
+    def as_dict(self):
+        return {'count': self.count, 'failures': self.failures, 'total': self.total, 'last': self.last,
+                'quantiles': {str(q): value for q, value in self.quantiles().items()},
+                'histogram': self.histogram()}
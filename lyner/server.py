@@ -0,0 +1,113 @@
+import base64
+import json
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+
+from .base import LynerException
+from .batch import _init_worker, _solve_source
+from .sources import TextSource, ImageSource
+
+# Requests and responses are exchanged as JSON objects, one per line. Requests
+# hold either a textual "puzzle" or base64-encoded "image" data, and optionally
+# "count" and "limit" to count the solutions instead. Responses are the same as
+# the results of batch mode.
+
+################################################################################
+### serve
+################################################################################
+
+def serve(solver, path=None, workers=1, counting_solver=None):
+    # Serves requests on a Unix domain socket until interrupted. The process,
+    # and with it the solver, its caches and the worker processes, stays warm
+    # in between requests. Each connection may send any number of requests.
+    # Solutions are counted by counting_solver, if given, such as the solver
+    # wrapped by a CachedSolver.
+    import concurrent.futures
+    path = path or default_socket_path()
+    _remove_stale_socket(path)
+    initargs = (solver, counting_solver)
+    if workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs)
+    else:
+        # A single thread, so that the solver is never used concurrently.
+        executor = concurrent.futures.ThreadPoolExecutor(1, initializer=_init_worker, initargs=initargs)
+    server = _Server(path, _Handler)
+    server.executor = executor
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+        executor.shutdown(cancel_futures=True)
+
+def _remove_stale_socket(path):
+    # Removes a socket left behind by a server that is no longer running, but
+    # neither other files nor the socket of a running server.
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise LynerException('{0} exists and is not a socket'.format(path))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+            return
+    raise LynerException('A server is already listening on {0}'.format(path))
+
+def default_socket_path():
+    directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(directory, 'lyner-{0}.sock'.format(os.getuid()))
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if not isinstance(request, dict):
+                    raise ValueError('Expected a JSON object')
+                if 'image' in request:
+                    request['image'] = base64.b64decode(request['image'], validate=True)
+            except (TypeError, ValueError) as e: # Including invalid base64 data.
+                result = {'status': 'error', 'error': 'Invalid request: {0}'.format(e)}
+            else:
+                result = self.server.executor.submit(_solve_request, request).result()
+            self.wfile.write(json.dumps(result).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+def _solve_request(request):
+    if 'image' in request:
+        source = ImageSource(request['image']) # Decoded by the handler.
+    else:
+        source = TextSource(request.get('puzzle'))
+    return _solve_source({}, source, request.get('count', False), request.get('limit'))
+
+################################################################################
+### request
+################################################################################
+
+def request(path=None, puzzle=None, image=None, count=False, limit=None):
+    # Sends a single request to a server and returns its response. The image
+    # is given as encoded image data (such as the contents of a PNG file).
+    message = {'puzzle': puzzle} if image is None else {'image': base64.b64encode(image).decode('ascii')}
+    if count:
+        message.update(count=True, limit=limit)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path or default_socket_path())
+        connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        with connection.makefile('rb') as response:
+            line = response.readline()
+    if not line:
+        raise ConnectionError('The server closed the connection')
+    return json.loads(line.decode('utf-8'))
@@ -1,7 +1,11 @@
 import collections
+import functools
+import heapq
+import operator
+import time
 
-from .base import Solver, LynerException
-from .utility import Board
+from .base import Solver, LynerException, SearchBudgetExceeded
+from .utility import Board, CompactBoard, Node, Edge
 
 ################################################################################
 ### GuidedDepthFirstSolver
@@ -9,44 +13,879 @@ from .utility import Board
 
 class GuidedDepthFirstSolver(Solver):
 
+    def __init__(self, compact=False, prune=False, table_size=0, jobs=1,
+                 max_nodes=None, max_time=None, progress=None, progress_interval=100000):
+        if compact and prune:
+            raise LynerException('Pruning requires the default board representation')
+        self.compact = compact
+        self.prune = prune
+        self.table_size = table_size
+        self.jobs = jobs
+        self.max_nodes = max_nodes # Expanded nodes before giving up.
+        self.max_time = max_time   # Seconds before giving up.
+        self.progress = progress   # Called with the stats every progress_interval nodes.
+        self.progress_interval = progress_interval
+        self.stats = SearchStats()
+        self.table = None
+
     def solve_puzzle(self, puzzle):
+        if self.jobs > 1:
+            self.stats = SearchStats()
+            try:
+                return _parallel_solve(puzzle, self.jobs, self.compact, self.prune, self.table_size,
+                                       self.stats, self.max_nodes, self.max_time, self.progress)
+            finally:
+                self.stats.stop()
+        solutions = self.solutions(puzzle)
         try:
-            return next(_solutions(Board(puzzle)))
+            return next(solutions)
         except StopIteration:
             raise LynerException('Failed to solve puzzle')
+        finally:
+            solutions.close()
+
+    def solutions(self, puzzle):
+        # Yields every solution lazily, in search order. Always searches serially.
+        self.stats = SearchStats()
+        self.table = TranspositionTable(self.table_size) if self.table_size else None
+        solutions = self._search(puzzle).solutions()
+        try:
+            yield from solutions
+        finally:
+            self.stats.stop()
+
+    def count_solutions(self, puzzle, limit=None):
+        # Counts the solutions without enumerating them, by memoizing the count
+        # of every search state. With a limit, counting stops as soon as there
+        # are more solutions than that, and limit + 1 is returned. Always
+        # searches serially.
+        self.stats = SearchStats()
+        self.table = None
+        try:
+            return self._search(puzzle).count(limit)
+        finally:
+            self.stats.stop()
+
+    def task(self, puzzle, snapshot=None):
+        # Returns a SearchTask, which searches serially, a slice at a time.
+        # Given a snapshot of an earlier task on the same puzzle, it resumes
+        # where that one left off.
+        self.stats = SearchStats()
+        self.table = TranspositionTable(self.table_size) if self.table_size else None
+        return SearchTask(self._search(puzzle), snapshot)
+
+    def _search(self, puzzle):
+        board = CompactBoard(puzzle) if self.compact else Board(puzzle)
+        return _Search(board, prune=self.prune, stats=self.stats, table=self.table,
+                       max_nodes=self.max_nodes, max_time=self.max_time,
+                       progress=self.progress, progress_interval=self.progress_interval)
+
+################################################################################
+### SearchStats
+################################################################################
+
+class SearchStats:
+
+    def __init__(self):
+        self.expanded = 0              # Nodes visited by the search.
+        self.backtracks = 0            # Nodes left without finding a solution.
+        self.max_depth = 0             # Most nodes on the paths at once.
+        self.branch_nodes = []         # Nodes that looked for candidates, per depth.
+        self.branch_candidates = []    # Candidates found, per depth.
+        self.color_time = collections.Counter() # Seconds per color (sampled).
+        self.pruned = collections.Counter()     # Pruned branches, per reason.
+        self.counters = collections.Counter()   # Other events, such as re-splits.
+        self.start = time.perf_counter()
+        self.end = None
+
+    def elapsed(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def stop(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    def branch(self, depth, candidates, nodes=1):
+        while len(self.branch_nodes) <= depth:
+            self.branch_nodes.append(0)
+            self.branch_candidates.append(0)
+        self.branch_nodes[depth] += nodes
+        self.branch_candidates[depth] += candidates
+
+    def branching_factors(self):
+        return [c / n if n else 0.0 for n, c in zip(self.branch_nodes, self.branch_candidates)]
+
+    def merge(self, other):
+        self.expanded += other.expanded
+        self.backtracks += other.backtracks
+        self.max_depth = max(self.max_depth, other.max_depth)
+        for depth, (nodes, candidates) in enumerate(zip(other.branch_nodes, other.branch_candidates)):
+            self.branch(depth, candidates, nodes)
+        self.color_time.update(other.color_time)
+        self.pruned.update(other.pruned)
+        self.counters.update(other.counters)
+
+    def as_dict(self):
+        return {'expanded': self.expanded, 'backtracks': self.backtracks, 'max_depth': self.max_depth,
+                'branching': self.branching_factors(), 'color_time': dict(self.color_time),
+                'pruned': dict(self.pruned), 'counters': dict(self.counters), 'elapsed': self.elapsed()}
+
+################################################################################
+### SearchTask
+################################################################################
+
+class SearchTask:
+
+    def __init__(self, search, snapshot=None):
+        self.search = search
+        if snapshot is None:
+            search.begin()
+        else:
+            search.restore(snapshot)
+
+    @property
+    def done(self):
+        return self.search.done and not self.search.pending
+
+    @property
+    def stats(self):
+        return self.search.stats
+
+    def step(self, max_expanded=None, max_time=None):
+        # Searches for at most max_expanded nodes or max_time seconds, and
+        # returns the next solution, or None if it was not found within that
+        # slice. Once the search is exhausted, done is set.
+        deadline = time.perf_counter() + max_time if max_time is not None else None
+        solution = self.search.advance(max_expanded, deadline)
+        if self.search.done:
+            self.search.stats.stop()
+        if solution is None:
+            return None
+        return self.search.positions(solution)
 
-def _solutions(board):
-    for solution in _next_type(board, collections.defaultdict(list)):
-        yield [[node.position for node in path] for path in solution.values()]
+    def snapshot(self):
+        # The frontier of the search, as plain data that can be pickled or
+        # stored as JSON and passed to GuidedDepthFirstSolver.task later.
+        return self.search.snapshot()
+
+    async def solve_async(self, max_expanded=10000):
+        # Returns the next solution, yielding to the event loop after every
+        # slice of max_expanded nodes.
+        import asyncio
+        while not self.done:
+            solution = self.step(max_expanded)
+            if solution is not None:
+                return solution
+            await asyncio.sleep(0)
+        raise LynerException('Failed to solve puzzle')
+
+################################################################################
+### _Search
+################################################################################
+
+_CHECK_INTERVAL = 256    # Expansions between budget checks and color time samples.
+_DEADLINE_INTERVAL = 64  # Expansions between checks of the deadline of a time slice.
+_NO_STEPS = iter(()) # The steps of frames that have none.
+
+class _Search:
+
+    def __init__(self, board, prune=False, stats=None, table=None,
+                 max_nodes=None, max_time=None, progress=None, progress_interval=100000):
+        self.board = board
+        if isinstance(board, CompactBoard):
+            # Nodes and edges are indices, and the search state is bitmasks.
+            self.operations = (board.visit_node, board.unvisit_node, board.visit_edge, board.unvisit_edge)
+            self.find_candidates = functools.partial(_find_compact_candidates, board)
+            self.position = board.positions.__getitem__
+            self.nodetype_of = board.nodetypes.__getitem__
+        else:
+            self.operations = (Node.visit, Node.unvisit, Edge.visit, Edge.unvisit)
+            self.find_candidates = _find_candidates
+            self.position = operator.attrgetter('position')
+            self.nodetype_of = operator.attrgetter('nodetype')
+        self.paths = collections.defaultdict(list)
+        self.prune = prune
+        self.stats = stats if stats is not None else SearchStats()
+        self.table = table # Known unsolvable states, or solution counts when counting.
+        self.counting = False
+        self.limit = None
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.depth = 0
+        self.nodetype = None
+        self.last_check = time.perf_counter()
+        self.next_check = self.stats.expanded + 1
+        self.next_progress = self.stats.expanded + progress_interval
+
+    def solutions(self):
+        self.begin()
+        while True:
+            solution = self.advance()
+            if solution is None:
+                return
+            yield self.positions(solution)
+
+    def positions(self, paths):
+        return [[self.position(node) for node in path] for path in paths.values()]
+
+    # The search runs on an explicit stack of frames, one per node on the
+    # paths, rather than on nested generators, so that it can be paused after
+    # any step and its depth is not limited by the recursion limit. A frame is
+    # a list of the path type, the node, the edge leading to it, an iterator
+    # over the (edge, node) steps to try from it, its transposition table
+    # state, the number of solutions found below it and the sequence of steps
+    # the iterator runs over. The last node of a path steps to the start of the next
+    # path, along no edge. The bottom frame is a root without a node, which
+    # steps to the start of the first path.
+
+    def begin(self):
+        root = [None, None, None, _NO_STEPS, None, 0, ()]
+        self.stack = [root]
+        self.done = False
+        self.pending = False # A solution found before the search has started.
+        board = self.board
+        if not board.has_remaining(goals=True):
+            self.pending = not board.has_remaining() # Solved without any paths.
+        else:
+            root[6] = ((None, board.remaining_goals()[0]),)
+            root[3] = iter(root[6])
+
+    def advance(self, max_expanded=None, deadline=None):
+        # Searches until the next solution, which is returned (as the paths),
+        # or until the search is exhausted or either limit is reached, in which
+        # case None is returned. The search is exhausted once self.done is set.
+        if self.pending:
+            self.pending = False
+            return self.paths
+        if self.done:
+            return None
+        stack = self.stack
+        stats = self.stats
+        board = self.board
+        paths = self.paths
+        table = self.table
+        prune = self.prune
+        counting = self.counting
+        limit = self.limit
+        candidates = self.candidates
+        visit_node, unvisit_node, visit_edge, unvisit_edge = self.operations
+        limited = max_expanded is not None or deadline is not None
+        expanded = 0
+        while True:
+            frame = stack[-1]
+            for edge, node in frame[3]:
+                break # Takes the next step, cheaper than calling next().
+            else:
+                # Leave the node.
+                nodetype, node, previous, steps, state, solved, sequence = frame
+                if node is None:
+                    break # Back at the root.
+                stack.pop()
+                if state is not None:
+                    if counting:
+                        table[state] = solved
+                    elif not solved:
+                        table.add(state)
+                unvisit_node(node)
+                paths[nodetype].pop()
+                if previous is not None:
+                    unvisit_edge(previous)
+                if solved:
+                    parent = stack[-1]
+                    parent[5] += solved
+                    if limit is not None and parent[5] > limit:
+                        parent[5] = limit + 1
+                        parent[3] = _NO_STEPS # Counted far enough.
+                else:
+                    stats.backtracks += 1
+                continue
+            # Enter the next node.
+            if edge is not None:
+                visit_edge(edge)
+                nodetype = frame[0]
+            else:
+                nodetype = self.nodetype_of(node)
+            stats.expanded += 1
+            if stats.expanded >= self.next_check:
+                self.checkpoint()
+            self.nodetype = nodetype
+            depth = self.depth = len(stack) # Counts the new node, but not the root.
+            if depth > stats.max_depth:
+                stats.max_depth = depth
+            visit_node(node)
+            paths[nodetype].append(node)
+            child = [nodetype, node, edge, _NO_STEPS, None, 0, ()]
+            stack.append(child)
+            if not board.has_remaining(nodetype, goals=True):
+                if not board.has_remaining(nodetype):
+                    if board.has_remaining(goals=True):
+                        steps = child[6] = ((None, board.remaining_goals()[0]),)
+                        child[3] = iter(steps)
+                    elif not board.has_remaining():
+                        child[5] = 1 # This is a valid solution.
+                        if not counting:
+                            return paths
+            else:
+                state = None
+                if table is not None:
+                    state = (board.zobrist, node, nodetype)
+                if state is not None and state in table:
+                    if counting:
+                        child[5] = table[state]
+                        stats.counters['memo hits'] += 1
+                    # Otherwise, it is already known to be a dead end.
+                else:
+                    child[4] = state
+                    if not prune or not self.is_dead_end(nodetype, node, edge):
+                        steps = child[6] = candidates(node, nodetype)
+                        child[3] = iter(steps)
+            if limited:
+                expanded += 1
+                if max_expanded is not None and expanded >= max_expanded:
+                    return None
+                if deadline is not None and expanded % _DEADLINE_INTERVAL == 0 and time.perf_counter() > deadline:
+                    return None
+        self.done = True
+        return None
+
+    # A snapshot records the frontier as the position, number of steps taken
+    # and number of solutions found of every frame above the root. The steps
+    # taken are those missing from the iterator, which must be over a list or
+    # tuple. It is restored by replaying the steps on a fresh board: the
+    # subtrees before the last step of each frame have already been searched,
+    # so they are skipped without being entered.
+
+    def snapshot(self):
+        return {'pending': self.pending, 'done': self.done,
+                'frames': [(self.position(frame[1]), len(frame[6]) - operator.length_hint(frame[3]), frame[5])
+                           for frame in self.stack[1:]]}
+
+    def restore(self, snapshot):
+        self.begin()
+        if snapshot['done']:
+            self.done = True
+            self.pending = False
+            return
+        frames = snapshot['frames']
+        for i, (position, taken, solved) in enumerate(frames):
+            # Take the step from the frame below to this one.
+            self.advance(max_expanded=1)
+            if len(self.stack) != i + 2 or self.position(self.stack[-1][1]) != tuple(position):
+                raise LynerException('The snapshot does not match the puzzle')
+            frame = self.stack[-1]
+            # Skip the steps that were searched, except the one being searched.
+            searched = taken if i == len(frames) - 1 else taken - 1
+            for _ in range(searched):
+                if next(frame[3], None) is None:
+                    raise LynerException('The snapshot does not match the puzzle')
+            frame[5] = solved
+        self.pending = snapshot['pending']
+
+    # Counting runs the same search, but carries on past solutions and adds up
+    # the solutions below each frame. The count of every search state is
+    # memoized in place of the transposition table. With a limit, a frame
+    # stops trying steps once it has more solutions than that.
+
+    def count(self, limit=None):
+        self.table = {}
+        self.counting = True
+        self.limit = limit
+        self.begin()
+        if self.pending:
+            return 1
+        self.advance()
+        return self.stack[0][5]
+
+    def candidates(self, node, nodetype):
+        candidates = self.find_candidates(node, nodetype)
+        self.stats.branch(self.depth, len(candidates))
+        return candidates
+
+    def is_dead_end(self, nodetype, head, previous):
+        reason = _dead_end(self.board, nodetype, head, previous)
+        if reason is not None:
+            self.stats.pruned[reason] += 1
+        return reason is not None
+
+    def checkpoint(self):
+        stats = self.stats
+        now = time.perf_counter()
+        if self.nodetype is not None:
+            stats.color_time[self.nodetype] += now - self.last_check
+        self.last_check = now
+        if self.max_nodes is not None and stats.expanded > self.max_nodes:
+            raise SearchBudgetExceeded('Gave up after expanding {0} nodes'.format(self.max_nodes))
+        if self.max_time is not None and now - stats.start > self.max_time:
+            raise SearchBudgetExceeded('Gave up after {0} seconds'.format(self.max_time))
+        if self.progress is not None and stats.expanded >= self.next_progress:
+            self.progress(stats)
+            self.next_progress += self.progress_interval
+        self.next_check = stats.expanded + _CHECK_INTERVAL
+        if self.max_nodes is not None:
+            self.next_check = min(self.next_check, self.max_nodes + 1)
+
+def _find_candidates(node, nodetype):
+    candidates = [(e, n) for e, n in node.links
+                  if not e.occupied and n.capacity > 0 and (n.neutral or n.nodetype == nodetype)]
+    if len(candidates) > 1:
+        candidates.sort(key=_candidate_priority)
+    return candidates
+
+def _candidate_priority(candidate):
+    edge, node = candidate
+    return -(node.capacity + node.neutral) # Prefer neutral nodes.
 
-def _next_type(board, paths):
+def _find_compact_candidates(board, node, nodetype):
+    # As _find_candidates, on a CompactBoard.
+    capacity, neutral, occupied = board.capacity, board.neutral, board.occupied
+    compatible = board.compatible[nodetype]
+    candidates = [(e, n) for e, n in board.adjacent[node]
+                  if not occupied >> e & 1 and capacity[n] > 0 and compatible[n]]
+    if len(candidates) > 1:
+        candidates.sort(key=lambda candidate: -(capacity[candidate[1]] + neutral[candidate[1]]))
+    return candidates
+
+################################################################################
+### Parallel search
+################################################################################
+
+# The search tree is split into work units, each a frontier of the search in
+# the form of the frames of a snapshot. The frames below the floor of a unit
+# are only replayed to reach it, as their remaining steps belong to earlier
+# units. A unit that turns out too large is split without repeating any work:
+# the remaining steps of each of its frames become new units. Units are
+# disjoint and cover the tree. Each unit also owns an interval of [0, 1) that
+# orders it in depth-first order, so that the first solution in serial order
+# can be picked.
+
+_UNIT_BUDGET = 20000    # Expansions before a unit is split.
+_CUTOFF_INTERVAL = 256  # Expansions between checks for cancellation.
+
+_cutoff = None # Shared start of the earliest solved unit, set in each worker.
+
+def _init_worker(cutoff):
+    global _cutoff
+    _cutoff = cutoff
+
+def _split_frontier(search, frames, floor, owned):
+    # Returns the remaining steps of each frame from the floor up as units,
+    # from the deepest frame to the shallowest, which is their depth-first
+    # order. A unit is its frames, its floor and the first of its frames
+    # whose backtracks it counts, as the units split off shallower frames
+    # leave the frames below that once more. The frames above the deepest
+    # unit are exhausted, so their backtracks are counted here.
+    current = search.snapshot()['frames']
+    current[:floor] = frames[:floor] # Their steps were cut off, not taken.
+    donors = [i for i in range(floor, len(current)) if operator.length_hint(search.stack[i + 1][3])]
+    if not donors:
+        return []
+    search.stats.backtracks += len(current) - 1 - donors[-1]
+    owners = [owned] + [i + 1 for i in donors[:-1]]
+    return [(current[:i + 1], i, owner) for i, owner in reversed(list(zip(donors, owners)))]
+
+def _solve_unit(puzzle, unit, start, compact, prune, table_size):
+    frames, floor, owned = unit
+    table = TranspositionTable(table_size) if table_size else None
+    board = CompactBoard(puzzle) if compact else Board(puzzle)
+    search = _Search(board, prune=prune, table=table)
+    search.restore({'pending': False, 'done': False, 'frames': frames})
+    for frame in search.stack[1:floor + 1]:
+        frame[3] = _NO_STEPS # Their remaining steps belong to other units.
+    stats = search.stats = SearchStats() # Replaying the frames is not part of the search.
+    while True:
+        if _cutoff.value < start:
+            return 'cancelled', None, stats # An earlier unit has been solved, or time is up.
+        solution = search.advance(_CUTOFF_INTERVAL)
+        if solution is not None:
+            return 'solved', search.positions(solution), stats
+        if search.done:
+            stats.backtracks -= owned # Left by the frames below, which other units count.
+            return 'solved', None, stats
+        if stats.expanded >= _UNIT_BUDGET:
+            units = _split_frontier(search, frames, floor, owned)
+            if units:
+                stats.counters['resplits'] += 1
+                return 'split', units, stats
+
+def _parallel_solve(puzzle, jobs, compact, prune, table_size, stats, max_nodes=None, max_time=None, progress=None):
+    import concurrent.futures, multiprocessing # Only needed here, and slow to import.
+    # Search serially first, which solves easy puzzles without starting any
+    # workers, and split the frontier it reaches.
+    table = TranspositionTable(table_size) if table_size else None
+    board = CompactBoard(puzzle) if compact else Board(puzzle)
+    search = _Search(board, prune=prune, stats=stats, table=table,
+                     max_nodes=max_nodes, max_time=max_time, progress=progress)
+    search.begin()
+    solution = search.advance(_UNIT_BUDGET)
+    while solution is None and not search.done:
+        units = _split_frontier(search, [], 0, 0)
+        if units:
+            break
+        solution = search.advance(_CUTOFF_INTERVAL)
+    if solution is not None:
+        return search.positions(solution)
+    if search.done:
+        raise LynerException('Failed to solve puzzle')
+    pending = [(i / len(units), 1 / len(units), unit) for i, unit in enumerate(units)]
+    unresolved = [start for start, width, unit in pending] # Starts of unfinished units.
+    best = None # The (start, solution) of the earliest solved unit.
+    cutoff = multiprocessing.Value('d', 1.0, lock=False)
+    with concurrent.futures.ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(cutoff,)) as pool:
+        running = {}
+        while unresolved and (best is None or min(unresolved) < best[0]):
+            # Keep the workers busy with the earliest pending units.
+            while pending and len(running) < jobs:
+                start, width, unit = heapq.heappop(pending)
+                if best is not None and start > best[0]:
+                    unresolved.remove(start)
+                    continue
+                future = pool.submit(_solve_unit, puzzle, unit, start, compact, prune, table_size)
+                running[future] = (start, width, unit)
+            if not running:
+                continue
+            timeout = max(0, max_time - stats.elapsed()) if max_time is not None else None
+            done, _ = concurrent.futures.wait(running, timeout, concurrent.futures.FIRST_COMPLETED)
+            if max_time is not None and stats.elapsed() > max_time:
+                cutoff.value = -1.0 # Cancel all units.
+                raise SearchBudgetExceeded('Gave up after {0} seconds'.format(max_time))
+            for future in done:
+                start, width, unit = running.pop(future)
+                status, result, unit_stats = future.result()
+                stats.merge(unit_stats)
+                unresolved.remove(start)
+                if status == 'split':
+                    for i, child in enumerate(result):
+                        child_start = start + width * i / len(result)
+                        heapq.heappush(pending, (child_start, width / len(result), child))
+                        unresolved.append(child_start)
+                elif status == 'solved' and result is not None:
+                    if best is None or start < best[0]:
+                        best = (start, result)
+                        cutoff.value = start # Cancel all later units.
+            if progress is not None:
+                progress(stats)
+            if max_nodes is not None and stats.expanded > max_nodes:
+                cutoff.value = -1.0
+                raise SearchBudgetExceeded('Gave up after expanding {0} nodes'.format(max_nodes))
+        for future in running:
+            future.cancel()
+    if best is None:
+        raise LynerException('Failed to solve puzzle')
+    return best[1]
+
+################################################################################
+### TranspositionTable
+################################################################################
+
+class TranspositionTable:
+
+    def __init__(self, maxsize=1000000):
+        self.maxsize = maxsize
+        self.states = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, state):
+        if state in self.states:
+            self.states.move_to_end(state)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def __len__(self):
+        return len(self.states)
+
+    def add(self, state):
+        self.states[state] = None
+        self.states.move_to_end(state)
+        while len(self.states) > self.maxsize:
+            self.states.popitem(last=False) # Evict the least recently used.
+            self.evictions += 1
+
+################################################################################
+### Dead-end pruning
+################################################################################
+
+def _dead_end(board, nodetype, head, previous):
+    # The goal and all remaining nodes of the type must be reachable from the head.
+    reachable = _reachable(head, nodetype)
+    if any(node not in reachable for node in board.remaining_nodes(nodetype)):
+        return 'reachability'
+    # Each remaining node needs enough usable edges to spend its capacity.
+    # Only the surroundings of the last step have changed since the parent was
+    # checked, unless this is the first step of a path.
+    if previous is None:
+        nodes = board.remaining_nodes()
+    else:
+        nodes = {head, previous.a, previous.b}
+        if previous.crosses is not None:
+            nodes.update((previous.crosses.a, previous.crosses.b))
+        for edge in head.edges + previous.a.edges + previous.b.edges:
+            nodes.update((edge.a, edge.b))
+    for node in nodes:
+        if (node.capacity > 0 or node is head) and \
+                _usable_degree(node, nodetype, head) < _required_degree(node, head):
+            return 'capacity'
+    return None
+
+def _reachable(head, nodetype):
+    reached, stack = {head}, [head]
+    while stack:
+        node = stack.pop()
+        if node.is_goal() and node is not head:
+            continue # Paths end at goals.
+        for edge in node.remaining_edges():
+            other = edge.a if edge.b is node else edge.b
+            if other not in reached and other.capacity > 0 and other.is_compatible(nodetype):
+                reached.add(other)
+                stack.append(other)
+    return reached
+
+def _usable_degree(node, nodetype, head):
+    degree = 0
+    for edge in node.remaining_edges():
+        other = edge.a if edge.b is node else edge.b
+        if other.capacity > 0 and (node.symbol.isdigit() or other.is_compatible(node.nodetype)):
+            degree += 1
+        elif other is head and node.is_compatible(nodetype):
+            degree += 1 # The current path may continue from the head.
+    return degree
+
+def _required_degree(node, head):
+    if node is head:
+        return 2 * node.capacity + 1 # Leave the head, then pass through.
+    if node.is_goal():
+        return 1
+    return 2 * node.capacity
+
+################################################################################
+### BidirectionalSolver
+################################################################################
+
+class BidirectionalSolver(Solver):
+
+    def __init__(self, max_nodes=None, max_time=None, max_halves=1000000):
+        self.max_nodes = max_nodes   # Half-paths grown before giving up.
+        self.max_time = max_time     # Seconds before giving up.
+        self.max_halves = max_halves # Half-paths of one length held at once before giving up.
+        self.stats = SearchStats()
+
+    def solve_puzzle(self, puzzle):
+        self.stats = SearchStats()
+        limits = (self.max_nodes, self.max_time, self.max_halves)
+        try:
+            return next(_bidirectional_solutions(CompactBoard(puzzle), self.stats, limits))
+        except StopIteration:
+            raise LynerException('Failed to solve puzzle')
+        finally:
+            self.stats.stop()
+
+def _bidirectional_solutions(board, stats, limits):
+    for solution in _bidirectional_next_type(board, {}, stats, limits):
+        yield [[board.positions[node] for node in path] for path in solution.values()]
+
+def _bidirectional_next_type(board, paths, stats, limits):
     remaining = board.remaining_goals()
     if len(remaining) == 0:
         if len(board.remaining_nodes()) == 0:
             yield paths # This is a valid solution.
+        return
+    nodetype = board.nodetypes[remaining[0]]
+    for path, edges in _color_paths(board, nodetype, stats, limits):
+        for node in path:
+            board.visit_node(node)
+        for edge in edges:
+            board.visit_edge(edge)
+        paths[nodetype] = path
+        yield from _bidirectional_next_type(board, paths, stats, limits)
+        del paths[nodetype]
+        for edge in edges:
+            board.unvisit_edge(edge)
+        for node in path:
+            board.unvisit_node(node)
+
+# A half-path is grown from one of the goals and is represented as a tuple of
+# (frontier node, occupied edge mask, visited node mask, capacity usage per
+# node, previous half-path, last edge). Half-paths with the same frontier,
+# occupied edges and capacity usage leave the board in the same state, so only
+# one of them is kept. Half-paths that leave a node it must still pass with
+# too few usable edges are dropped, as in the capacity check of the guided
+# search. Only the half-paths of the current length are held, along with
+# the shorter ones they were grown from.
+
+def _color_paths(board, nodetype, stats, limits):
+    # Yields every path between the two goals of a color, by increasing length,
+    # that visits all of its remaining colored nodes. Paths are found by joining
+    # half-paths grown from both goals, each about half as long as the path.
+    goals = board.remaining_goals(nodetype)
+    if len(goals) != 2:
+        return
+    first, last = goals
+    capacity, compatible = board.capacity, board.compatible[nodetype]
+    limit = sum(capacity[node] for node in range(len(capacity)) if compatible[node]) - 1
+    if len(board.remaining_goals()) == 2:
+        # The last color has to use up every remaining node, which determines
+        # both the length of the path and the capacity used on every node.
+        determined = board.remaining_nodes()
+        if not all(compatible[node] for node in determined):
+            return
+        lengths = [limit]
     else:
-        yield from _next_node(board, paths, remaining[0].nodetype, remaining[0])
-
-def _next_node(board, paths, nodetype, node):
-    node.visit()
-    paths[nodetype].append(node)
-    if len(board.remaining_goals(nodetype)) == 0:
-        if len(board.remaining_nodes(nodetype)) == 0:
-            yield from _next_type(board, paths)
-    else:
-        for edge, other in _find_candidates(node, nodetype):
-            edge.visit()
-            yield from _next_node(board, paths, nodetype, other)
-            edge.unvisit()
-    node.unvisit()
-    paths[nodetype].pop()
+        # Other colors only have to visit their own colored nodes.
+        determined = board.remaining_nodes(nodetype)
+        lengths = range(1, limit + 1)
+    required = bytearray(len(capacity))
+    for node in determined:
+        required[node] = 1
+    # A half-path can only be joined with those using the rest of the capacity
+    # of the determined nodes, which are looked up by their exact usage.
+    target = [capacity[node] for node in determined]
+    forward, f_length = [_start_half(board, first)], 0
+    backward, b_length = [_start_half(board, last)], 0
+    index = None # Forward half-paths by frontier and determined usage.
+    for length in lengths:
+        f, b = (length + 1) // 2, length // 2
+        while f_length < f:
+            forward = _extend_halves(board, forward, compatible, required, last, stats, limits)
+            f_length += 1
+            stats.max_depth = max(stats.max_depth, f_length)
+            index = None
+        while b_length < b:
+            backward = _extend_halves(board, backward, compatible, required, first, stats, limits)
+            b_length += 1
+        if not forward or not backward:
+            return # No longer half-paths exist.
+        if index is None:
+            index = collections.defaultdict(list)
+            for half in forward:
+                usage = half[3]
+                index[half[0], bytes(usage[node] for node in determined)].append(half)
+        seen = set()
+        for half in backward:
+            meeting, usage = half[0], half[3]
+            rest = [t - usage[node] + (node == meeting) for t, node in zip(target, determined)]
+            if min(rest, default=0) < 0:
+                continue
+            for other in index.get((meeting, bytes(rest)), ()):
+                joined = _join_halves(board, other, half)
+                if joined is None:
+                    continue
+                stats.counters['joins'] += 1
+                state, path, edges = joined
+                if state in seen:
+                    stats.counters['duplicate paths'] += 1
+                    continue
+                seen.add(state)
+                yield path, edges
 
-def _find_candidates(node, nodetype):
-    candidates = [(e, e.a if e.b is node else e.b) for e in node.remaining_edges()]
-    candidates = [(e, n) for e, n in candidates if n.is_compatible(nodetype) and n.capacity > 0]
-    candidates = sorted(candidates, key=_candidate_priority)
-    return candidates
+def _start_half(board, node):
+    usage = bytearray(len(board.capacity))
+    usage[node] = 1
+    return (node, 0, 1 << node, bytes(usage), None, None)
 
-def _candidate_priority(candidate):
-    edge, node = candidate
-    return -(node.capacity + int(node.symbol.isdigit())) # Prefer neutral nodes.
+def _extend_halves(board, halves, compatible, required, goal, stats, limits):
+    # Extends each half-path by one edge. Half-paths may step onto the other
+    # goal, but not beyond it.
+    capacity, conflicts, adjacent = board.capacity, board.conflicts, board.adjacent
+    extended = {}
+    for half in halves:
+        frontier, occupied, visited, usage = half[:4]
+        if frontier == goal:
+            continue
+        blocked = board.occupied | occupied
+        for edge, other in adjacent[frontier]:
+            if blocked >> edge & 1 or not compatible[other] or usage[other] >= capacity[other]:
+                continue
+            used = bytearray(usage)
+            used[other] += 1
+            used = bytes(used)
+            key = (other, occupied | conflicts[edge], used)
+            if key in extended:
+                stats.counters['duplicate halves'] += 1
+                continue
+            stats.expanded += 1
+            if stats.expanded % _CHECK_INTERVAL == 0:
+                _check_limits(stats, limits, len(extended))
+            if _stranded(board, _affected(board, frontier, other, edge), other, goal,
+                         board.occupied | key[1], used, compatible, required):
+                extended[key] = None # Known to be a dead end.
+                stats.pruned['capacity'] += 1
+                continue
+            extended[key] = (other, key[1], visited | 1 << other, used, half, edge)
+    return [half for half in extended.values() if half is not None]
+
+def _affected(board, frontier, head, edge):
+    # The nodes whose usable edges may have changed by stepping from the
+    # frontier to the head along the edge.
+    nodes = {frontier, head}
+    nodes.update(other for e, other in board.adjacent[frontier])
+    nodes.update(other for e, other in board.adjacent[head])
+    crossing = board.conflicts[edge] & ~(1 << edge)
+    if crossing:
+        nodes.update(board.edges[crossing.bit_length() - 1])
+    return nodes
+
+def _stranded(board, nodes, head, goal, blocked, usage, compatible, required):
+    # Returns whether any of the nodes has fewer usable edges left than the
+    # rest of the path needs: two for each time it must still be passed, one
+    # to reach the goal, and one more to leave the head.
+    capacity, adjacent = board.capacity, board.adjacent
+    for node in nodes:
+        left = capacity[node] - usage[node]
+        if node == head:
+            needed = 0 if node == goal else 1 + 2 * left * required[node]
+        elif node == goal:
+            needed = left
+        else:
+            needed = 2 * left * required[node]
+        if not needed:
+            continue
+        usable = 0
+        for edge, other in adjacent[node]:
+            if not blocked >> edge & 1 and (other == head or compatible[other] and capacity[other] > usage[other]):
+                usable += 1
+        if usable < needed:
+            return True
+    return False
+
+def _check_limits(stats, limits, held):
+    max_nodes, max_time, max_halves = limits
+    if max_nodes is not None and stats.expanded > max_nodes:
+        raise SearchBudgetExceeded('Gave up after growing {0} half-paths'.format(max_nodes))
+    if max_time is not None and stats.elapsed() > max_time:
+        raise SearchBudgetExceeded('Gave up after {0} seconds'.format(max_time))
+    if max_halves is not None and held > max_halves:
+        raise SearchBudgetExceeded('Gave up after holding {0} half-paths of one length'.format(max_halves))
+
+def _join_halves(board, forward, backward):
+    # Joins two half-paths meeting at the same frontier node, if they neither
+    # share nor cross an edge and don't exceed any node's capacity together.
+    meeting, occupied, visited, usage = forward[:4]
+    if occupied & backward[1]:
+        return None
+    other_usage = backward[3]
+    shared = visited & backward[2]
+    while shared:
+        node = (shared & -shared).bit_length() - 1
+        shared &= shared - 1
+        if usage[node] + other_usage[node] - (node == meeting) > board.capacity[node]:
+            return None
+    combined = bytearray(a + b for a, b in zip(usage, other_usage))
+    combined[meeting] -= 1
+    state = (occupied | backward[1], bytes(combined))
+    nodes, edges = _unwind_half(forward)
+    other_nodes, other_edges = _unwind_half(backward)
+    return state, nodes + other_nodes[-2::-1], edges + other_edges
+
+def _unwind_half(half):
+    nodes, edges = [], []
+    while half is not None:
+        nodes.append(half[0])
+        if half[5] is not None:
+            edges.append(half[5])
+        half = half[4]
+    return nodes[::-1], edges[::-1]
@@ -1,7 +1,26 @@
+import array
 import collections
+import functools
+import io
 import itertools
+import math
+import random
 
-import PIL.Image
+# PIL and NumPy (if installed) are only imported once an image is parsed, as
+# they are slow to import and not needed for textual puzzles.
+PIL = None
+numpy = None
+_imaging_imported = False
+
+def _import_imaging():
+    global PIL, numpy, _imaging_imported
+    if not _imaging_imported:
+        import PIL.Image
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _imaging_imported = True
 
 ################################################################################
 ### Board
@@ -11,29 +30,42 @@ class Board:
 
     def __init__(self, puzzle):
         self.puzzle = puzzle
+        rows = puzzle.split('/')
+        topology = _topology(puzzle.translate(_SHAPE))
         # Create nodes.
         self.nodes_2d = [[Node(value, (i, j))
                          for j, value in enumerate(row)]
-                         for i, row in enumerate(puzzle.split('/'))]
+                         for i, row in enumerate(rows)]
         self.nodes = [node for row in self.nodes_2d for node in row]
-        # Create edges.
-        last_se = None
-        for node in self.nodes:
-            n0, n1 = node.position
-            neighbors = (self.node(n0 + i, n1 + j)
-                         for i, j in [(0, 1), (1, 0), (1, 1), (1, -1)])
-            e, s, se, sw = (Edge(node, neighbor) if neighbor is not None else None
-                            for neighbor in neighbors)
-            # Add edges to nodes.
-            for edge in (e, s, se, sw):
-                if edge is not None:
-                    edge.a.edges.append(edge)
-                    edge.b.edges.append(edge)
-            # Connect crossing edges.
-            if sw is not None and last_se is not None:
-                sw.crosses = last_se
-                last_se.crosses = sw
-            last_se = se
+        # Create edges, and connect crossing edges.
+        nodes = self.nodes
+        self.edges = [Edge(nodes[a], nodes[b]) for a, b in topology.edges]
+        edges = self.edges
+        for a, b in topology.crossings:
+            edges[a].crosses = edges[b]
+            edges[b].crosses = edges[a]
+        # Add edges to nodes, and link each node to its neighbors.
+        for node, links in zip(nodes, topology.adjacent):
+            node.edges = [edges[edge] for edge, other in links]
+            node.links = tuple((edges[edge], nodes[other]) for edge, other in links)
+        # Count remaining capacity and goals per type. The counts are
+        # maintained incrementally by visits.
+        self.goals = [node for node in nodes if node.goal]
+        self.capacity_left = collections.Counter()
+        self.goals_left = collections.Counter()
+        for node in nodes:
+            self.capacity_left[node.nodetype] += node.capacity
+            self.goals_left[node.nodetype] += node.goal
+        self.total_capacity_left = sum(self.capacity_left.values())
+        self.total_goals_left = len(self.goals)
+        # Assign Zobrist keys. The hash is maintained incrementally by visits.
+        self.zobrist = 0
+        for node, keys in zip(nodes, topology.node_keys):
+            node.board = self
+            node.keys = keys
+        for edge, key in zip(edges, topology.edge_keys):
+            edge.board = self
+            edge.key = key
 
     def node(self, row, col):
         if 0 <= row < len(self.nodes_2d) and 0 <= col < len(self.nodes_2d[row]):
@@ -45,7 +77,13 @@ class Board:
                 if n.capacity > 0 and (nodetype is None or n.nodetype == nodetype)]
 
     def remaining_goals(self, nodetype=None):
-        return [n for n in self.remaining_nodes(nodetype) if n.is_goal()]
+        return [n for n in self.goals
+                if n.capacity > 0 and (nodetype is None or n.nodetype == nodetype)]
+
+    def has_remaining(self, nodetype=None, goals=False):
+        if nodetype is None:
+            return (self.total_goals_left if goals else self.total_capacity_left) > 0
+        return (self.goals_left if goals else self.capacity_left)[nodetype] > 0
 
 ################################################################################
 ### Node
@@ -58,12 +96,33 @@ class Node:
         self.nodetype = symbol.upper()
         self.position = position
         self.capacity = int(symbol) if symbol.isdigit() else 1
+        self.neutral = symbol.isdigit()
+        self.goal = symbol.isupper()
         self.edges = []
+        self.links = () # (edge, other node) per edge.
+        self.board = None
+        self.keys = None # Zobrist keys, one per capacity step.
 
     def visit(self):
         self.capacity -= 1
+        board = self.board
+        if board is not None:
+            board.zobrist ^= self.keys[self.capacity]
+            board.capacity_left[self.nodetype] -= 1
+            board.total_capacity_left -= 1
+            if self.goal:
+                board.goals_left[self.nodetype] -= 1
+                board.total_goals_left -= 1
 
     def unvisit(self):
+        board = self.board
+        if board is not None:
+            board.zobrist ^= self.keys[self.capacity]
+            board.capacity_left[self.nodetype] += 1
+            board.total_capacity_left += 1
+            if self.goal:
+                board.goals_left[self.nodetype] += 1
+                board.total_goals_left += 1
         self.capacity += 1
 
     def is_compatible(self, symbol):
@@ -86,16 +145,175 @@ class Edge:
         self.b = node_b
         self.occupied = False
         self.crosses = None
+        self.board = None
+        self.key = 0 # Zobrist key.
 
     def visit(self):
         self.occupied = True
         if self.crosses is not None:
             self.crosses.occupied = True
+        self._toggle_key()
 
     def unvisit(self):
         self.occupied = False
         if self.crosses is not None:
             self.crosses.occupied = False
+        self._toggle_key()
+
+    def _toggle_key(self):
+        if self.board is not None:
+            self.board.zobrist ^= self.key
+            if self.crosses is not None:
+                self.board.zobrist ^= self.crosses.key
+
+################################################################################
+### CompactBoard
+################################################################################
+
+class CompactBoard:
+
+    def __init__(self, puzzle):
+        self.puzzle = puzzle
+        rows = puzzle.split('/')
+        # Create nodes, identified by their row-major index.
+        self.positions = [(i, j) for i, row in enumerate(rows) for j in range(len(row))]
+        self.symbols = [value for row in rows for value in row]
+        self.nodetypes = [symbol.upper() for symbol in self.symbols]
+        self.neutral = [symbol.isdigit() for symbol in self.symbols]
+        self.goals = [symbol.isupper() for symbol in self.symbols]
+        self.capacity = array.array('b', (int(symbol) if symbol.isdigit() else 1
+                                          for symbol in self.symbols))
+        # Index nodes and goals by type, and compatibility by type.
+        self.typed = collections.defaultdict(list)
+        self.typed_goals = collections.defaultdict(list)
+        for n, nodetype in enumerate(self.nodetypes):
+            self.typed[nodetype].append(n)
+            if self.goals[n]:
+                self.typed_goals[nodetype].append(n)
+        self.compatible = {nodetype: [self.neutral[n] or self.nodetypes[n] == nodetype
+                                      for n in range(len(self.positions))]
+                           for nodetype in self.typed_goals}
+        # Share the edges of all puzzles of the same shape.
+        topology = _topology(puzzle.translate(_SHAPE))
+        self.edges = topology.edges         # The (a, b) node indices of each edge.
+        self.conflicts = topology.conflicts # Bitmask of the edge itself and its crossing edge.
+        self.adjacent = topology.adjacent   # (edge, other) per node.
+        self.occupied = 0 # Bitmask of occupied edges.
+        # Count remaining capacity and goals per type, and keep the same
+        # Zobrist hash as Board, all maintained incrementally by visits.
+        self.capacity_left = collections.Counter()
+        self.goals_left = collections.Counter()
+        for n, nodetype in enumerate(self.nodetypes):
+            self.capacity_left[nodetype] += self.capacity[n]
+            self.goals_left[nodetype] += self.goals[n]
+        self.total_capacity_left = sum(self.capacity_left.values())
+        self.total_goals_left = sum(self.goals)
+        self.node_keys = topology.node_keys
+        self.conflict_keys = topology.conflict_keys
+        self.zobrist = 0
+
+    def visit_node(self, node):
+        capacity = self.capacity[node] - 1
+        self.capacity[node] = capacity
+        self.zobrist ^= self.node_keys[node][capacity]
+        self.capacity_left[self.nodetypes[node]] -= 1
+        self.total_capacity_left -= 1
+        if self.goals[node]:
+            self.goals_left[self.nodetypes[node]] -= 1
+            self.total_goals_left -= 1
+
+    def unvisit_node(self, node):
+        capacity = self.capacity[node]
+        self.capacity[node] = capacity + 1
+        self.zobrist ^= self.node_keys[node][capacity]
+        self.capacity_left[self.nodetypes[node]] += 1
+        self.total_capacity_left += 1
+        if self.goals[node]:
+            self.goals_left[self.nodetypes[node]] += 1
+            self.total_goals_left += 1
+
+    def visit_edge(self, edge):
+        self.occupied |= self.conflicts[edge]
+        self.zobrist ^= self.conflict_keys[edge]
+
+    def unvisit_edge(self, edge):
+        self.occupied &= ~self.conflicts[edge]
+        self.zobrist ^= self.conflict_keys[edge]
+
+    def remaining_nodes(self, nodetype=None):
+        nodes = range(len(self.positions)) if nodetype is None else self.typed[nodetype]
+        return [n for n in nodes if self.capacity[n] > 0]
+
+    def remaining_goals(self, nodetype=None):
+        if nodetype is None:
+            return [n for n in self.remaining_nodes() if self.goals[n]]
+        return [n for n in self.typed_goals[nodetype] if self.capacity[n] > 0]
+
+    def has_remaining(self, nodetype=None, goals=False):
+        if nodetype is None:
+            return (self.total_goals_left if goals else self.total_capacity_left) > 0
+        return (self.goals_left if goals else self.capacity_left)[nodetype] > 0
+
+################################################################################
+### _Topology
+################################################################################
+
+# Maps puzzles to their shape, in which all present nodes are '1'.
+_SHAPE = str.maketrans({symbol: '1' for symbol in
+                        '123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'})
+
+_MAX_CAPACITY = 9
+
+class _Topology:
+
+    # The edges of all puzzles of one shape, which only depend on the sizes of
+    # the rows and on which nodes are missing. Edges are created in row-major
+    # order of their first node, heading east, south, south-east and
+    # south-west. Edges to missing nodes are left out, as they are never used.
+
+    def __init__(self, shape):
+        rows = shape.split('/')
+        positions = [(i, j) for i, row in enumerate(rows) for j in range(len(row))]
+        index = {position: n for n, position in enumerate(positions)
+                 if rows[position[0]][position[1]] != '0'}
+        self.edges = []     # The (a, b) node indices of each edge.
+        self.crossings = [] # The (se, sw) edge indices of each pair of crossing edges.
+        self.conflicts = [] # Bitmask of the edge itself and its crossing edge.
+        adjacent = [[] for n in positions] # (edge, other) per node.
+        last_se = None
+        for n0, n1 in positions:
+            a = index.get((n0, n1))
+            se = None
+            for direction, (i, j) in enumerate([(0, 1), (1, 0), (1, 1), (1, -1)]):
+                b = index.get((n0 + i, n1 + j))
+                if a is None or b is None:
+                    continue
+                edge = len(self.edges)
+                self.edges.append((a, b))
+                self.conflicts.append(1 << edge)
+                adjacent[a].append((edge, b))
+                adjacent[b].append((edge, a))
+                if direction == 2:
+                    se = edge
+                elif direction == 3 and last_se is not None:
+                    self.crossings.append((last_se, edge))
+                    self.conflicts[edge] |= 1 << last_se
+                    self.conflicts[last_se] |= 1 << edge
+            last_se = se
+        self.adjacent = [tuple(links) for links in adjacent]
+        # Zobrist keys, for every capacity step of every node and every edge.
+        keys = random.Random(0)
+        self.node_keys = [[keys.getrandbits(64) for i in range(_MAX_CAPACITY)] for n in positions]
+        self.edge_keys = [keys.getrandbits(64) for edge in self.edges]
+        # The keys of each edge and its crossing edge, which are occupied together.
+        self.conflict_keys = list(self.edge_keys)
+        for a, b in self.crossings:
+            self.conflict_keys[a] ^= self.edge_keys[b]
+            self.conflict_keys[b] ^= self.edge_keys[a]
+
+@functools.lru_cache(maxsize=1024)
+def _topology(shape):
+    return _Topology(shape)
 
 ################################################################################
 ### _Rectangle
@@ -126,22 +344,171 @@ class _Rectangle:
             self.top    = min(self.top,    y)
             self.bottom = max(self.bottom, y)
 
+################################################################################
+### plan_replay
+################################################################################
+
+_EXACT_PATHS = 8 # Orders of up to this many paths are optimized exactly.
+
+def plan_replay(solution, collapse=False):
+    # Returns the paths of a solution in the order and direction in which to
+    # draw them, so that the pointer travels as little as possible between the
+    # end of one path and the start of the next. With collapse, the nodes in
+    # the middle of straight runs are left out, so each run is a single drag.
+    paths = [list(path) for path in solution]
+    if len(paths) <= _EXACT_PATHS:
+        paths = _exact_order(paths)
+    else:
+        paths = _greedy_order(paths)
+    if collapse:
+        paths = [_collapse(path) for path in paths]
+    return paths
+
+def _distance(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+def _exact_order(paths):
+    # Finds the shortest tour over all paths by dynamic programming over the
+    # set of paths drawn so far and the last path drawn, along with whether it
+    # was drawn reversed.
+    ends = [(path[0], path[-1]) for path in paths]
+    def start(i, reverse):
+        return ends[i][1 if reverse else 0]
+    def end(i, reverse):
+        return ends[i][0 if reverse else 1]
+    best = {(1 << i, i, reverse): (0, None) for i in range(len(paths)) for reverse in (False, True)}
+    for mask in range(1, 1 << len(paths)):
+        for i in range(len(paths)):
+            for reverse in (False, True):
+                if (mask, i, reverse) not in best:
+                    continue
+                cost = best[mask, i, reverse][0]
+                for j in range(len(paths)):
+                    if mask & (1 << j):
+                        continue
+                    for reverse_j in (False, True):
+                        state = (mask | (1 << j), j, reverse_j)
+                        total = cost + _distance(end(i, reverse), start(j, reverse_j))
+                        if state not in best or total < best[state][0]:
+                            best[state] = (total, (mask, i, reverse))
+    full = (1 << len(paths)) - 1
+    state = min((state for state in best if state[0] == full), key=lambda state: best[state][0])
+    ordered = []
+    while state is not None:
+        mask, i, reverse = state
+        ordered.append(paths[i][::-1] if reverse else paths[i])
+        state = best[state][1]
+    return ordered[::-1]
+
+def _greedy_order(paths):
+    # Starts with the first path and repeatedly continues with the nearest end
+    # of any remaining path.
+    ordered = [paths[0]]
+    remaining = paths[1:]
+    while remaining:
+        end = ordered[-1][-1]
+        path = min(remaining, key=lambda path: min(_distance(end, path[0]), _distance(end, path[-1])))
+        remaining.remove(path)
+        ordered.append(path if _distance(end, path[0]) <= _distance(end, path[-1]) else path[::-1])
+    return ordered
+
+def _collapse(path):
+    # Keeps the ends of the path and the nodes at which it changes direction.
+    kept = path[:1]
+    for previous, node, following in zip(path, path[1:], path[2:]):
+        if (node[0] - previous[0], node[1] - previous[1]) != (following[0] - node[0], following[1] - node[1]):
+            kept.append(node)
+    return kept + path[-1:] if len(path) > 1 else kept
+
 ################################################################################
 ### parse_image
 ################################################################################
 
+_COLORS = {(168, 219, 168): 'a', # Triangle
+           ( 59, 134, 134): 'b', # Diamond
+           (194, 120,  92): 'c', # Square
+           (206, 240, 183): 'A', # Triangle (goal)
+           ( 11,  72, 107): 'B', # Diamond (goal)
+           (190,  79,  35): 'C', # Square (goal)
+           (167, 219, 216): '0'} # Neutral
+_BGCOLOR = (121, 189, 154)       # Background
+
 def parse_image(imagefile, return_coords=False):
-    colors = {(168, 219, 168): 'a', # Triangle
-              ( 59, 134, 134): 'b', # Diamond
-              (194, 120,  92): 'c', # Square
-              (206, 240, 183): 'A', # Triangle (goal)
-              ( 11,  72, 107): 'B', # Diamond (goal)
-              (190,  79,  35): 'C', # Square (goal)
-              (167, 219, 216): '0'} # Neutral
-    bgcolor = (121, 189, 154)       # Background
-    # Load image.
-    image = PIL.Image.open(imagefile)
-    image = image.convert(mode='RGB')
+    # Load image. Accepts a path, a file object, encoded image data (such as
+    # PPM), a PIL image or an RGB array.
+    image = _load_image(imagefile)
+    # Find sections containing nodes, with neutral nodes split by hole count.
+    if numpy is not None:
+        sections = _find_sections_vectorized(image if isinstance(image, numpy.ndarray) else numpy.asarray(image))
+    else:
+        sections = _find_sections(image)
+    # Find grid structure.
+    nodes = [(symbol, rect) for symbol, sect in sections.items() for rect in sect]
+    grid_rows, grid_cols = {}, {}
+    row_known, col_known = set(), set()
+    for node in nodes:
+        if node not in row_known:
+            cx, cy = node[1].center()
+            grid_rows[cy] = [n for n in nodes if n[1].top <= cy <= n[1].bottom]
+            row_known |= set(grid_rows[cy])
+        if node not in col_known:
+            cx, cy = node[1].center()
+            grid_cols[cx] = [n for n in nodes if n[1].left <= cx <= n[1].right]
+            col_known |= set(grid_cols[cx])
+    row_coords = sorted(grid_rows)
+    col_coords = sorted(grid_cols)
+    grid = [[''] * len(grid_cols) for row in grid_rows]
+    for i, row in enumerate(grid):
+        for j in range(len(row)):
+            r, c = row_coords[i], col_coords[j]
+            row[j] = next((n[0] for n in grid_rows[r] if n in grid_cols[c]), '0')
+    # Convert to textual description.
+    puzzle = '/'.join(''.join(row) for row in grid)
+    return puzzle if not return_coords else (puzzle, row_coords, col_coords)
+
+def _load_image(image):
+    _import_imaging()
+    if numpy is not None and isinstance(image, numpy.ndarray):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        header = ppm_header(image)
+        if header is not None:
+            # Wrap the raw pixel data without copying it.
+            width, height, offset = header
+            if numpy is not None:
+                return numpy.frombuffer(image, numpy.uint8, 3 * width * height, offset).reshape(height, width, 3)
+            return PIL.Image.frombuffer('RGB', (width, height), memoryview(image)[offset:], 'raw', 'RGB', 0, 1)
+        image = io.BytesIO(image)
+    if not isinstance(image, PIL.Image.Image):
+        image = PIL.Image.open(image)
+    return image.convert(mode='RGB')
+
+def ppm_header(data):
+    # Returns the (width, height, offset of the pixel data) of 8-bit binary PPM
+    # data, or None for other data. Accepts any buffer, such as a memoryview,
+    # whose slices are converted to bytes before they are inspected.
+    if bytes(data[:2]) != b'P6':
+        return None
+    byte = lambda position: bytes(data[position:position + 1])
+    fields, position = [], 2
+    while len(fields) < 3:
+        while byte(position).isspace():
+            position += 1
+        if byte(position) == b'#': # Skip comments.
+            while byte(position) not in (b'\n', b''):
+                position += 1
+            continue
+        start = position
+        while byte(position).isdigit():
+            position += 1
+        if start == position:
+            return None
+        fields.append(int(bytes(data[start:position])))
+    width, height, maxval = fields
+    return (width, height, position + 1) if maxval == 255 else None
+
+def _find_sections(image):
+    colors, bgcolor = _COLORS, _BGCOLOR
     width, height = image.size
     pixels = image.load()
     # Find sections containing nodes.
@@ -160,40 +527,91 @@ def parse_image(imagefile, return_coords=False):
             current[1].expand(x, y)
         else:
             current = None
+    _remove_false_positives(sections)
+    # Count the holes in the neutral nodes.
+    for r in sections['0']:
+        cx, cy = r.center()
+        num = sum((any(pixels[cx, y] == bgcolor for y in range(cy, r.top, -1)),  # Up
+                   any(pixels[cx, y] == bgcolor for y in range(cy, r.bottom)),   # Down
+                   any(pixels[x, cy] == bgcolor for x in range(cx, r.left, -1)), # Left
+                   any(pixels[x, cy] == bgcolor for x in range(cx, r.right))))   # Right
+        sections[str(num)].append(r)
+    del sections['0']
+    return sections
+
+def _remove_false_positives(sections):
     # Remove false positives within goal nodes.
     for lower in ('a', 'b', 'c'):
         for goal in sections[lower.upper()]:
             for rect in [r for r in sections[lower] if r.center() in goal]:
                 sections[lower].remove(rect)
+
+################################################################################
+### parse_image (vectorized)
+################################################################################
+
+def _find_sections_vectorized(pixels, threshold=10):
+    # Works on the transposed image, so that pixels are found in the same
+    # column-major order as _find_sections scans them.
+    height, width = pixels.shape[:2]
+    packed = _pack(pixels.astype(numpy.uint32, copy=False)).T
+    colors = sorted(_COLORS, key=_pack)
+    keys = numpy.array([_pack(color) for color in colors], dtype=numpy.uint32)
+    symbols = [_COLORS[color] for color in colors]
+    xs, ys = numpy.nonzero(numpy.isin(packed, keys))
+    kinds = numpy.searchsorted(keys, packed[xs, ys])
+    # Label blobs of same-colored pixels as connected components of a grid of
+    # cells, so that pixels close to each other are joined like _Rectangle.near
+    # does.
+    cells, blobs = _label_cells(kinds, xs // threshold, ys // threshold)
+    labels = blobs[cells]
+    unique, first = numpy.unique(labels, return_index=True)
+    index = numpy.searchsorted(unique, labels)
+    lefts = numpy.full(len(unique), width);  numpy.minimum.at(lefts, index, xs)
+    rights = numpy.full(len(unique), -1);    numpy.maximum.at(rights, index, xs)
+    tops = numpy.full(len(unique), height);  numpy.minimum.at(tops, index, ys)
+    bottoms = numpy.full(len(unique), -1);   numpy.maximum.at(bottoms, index, ys)
+    # Insert in order of first appearance, like the scan in _find_sections.
+    sections = collections.defaultdict(list)
+    for i in numpy.argsort(first, kind='stable').tolist():
+        rect = _Rectangle(int(lefts[i]), int(tops[i]))
+        rect.expand(int(rights[i]), int(bottoms[i]))
+        sections[symbols[kinds[first[i]]]].append(rect)
+    _remove_false_positives(sections)
     # Count the holes in the neutral nodes.
+    bgkey = _pack(_BGCOLOR)
     for r in sections['0']:
         cx, cy = r.center()
-        num = sum((any(pixels[cx, y] == bgcolor for y in range(cy, r.top, -1)),  # Up
-                   any(pixels[cx, y] == bgcolor for y in range(cy, r.bottom)),   # Down
-                   any(pixels[x, cy] == bgcolor for x in range(cx, r.left, -1)), # Left
-                   any(pixels[x, cy] == bgcolor for x in range(cx, r.right))))   # Right
+        num = sum(((packed[cx, r.top + 1:cy + 1] == bgkey).any(),  # Up
+                   (packed[cx, cy:r.bottom] == bgkey).any(),       # Down
+                   (packed[r.left + 1:cx + 1, cy] == bgkey).any(), # Left
+                   (packed[cx:r.right, cy] == bgkey).any()))       # Right
         sections[str(num)].append(r)
     del sections['0']
-    # Find grid structure.
-    nodes = [(symbol, rect) for symbol, sect in sections.items() for rect in sect]
-    grid_rows, grid_cols = {}, {}
-    row_known, col_known = set(), set()
-    for node in nodes:
-        if node not in row_known:
-            cx, cy = node[1].center()
-            grid_rows[cy] = [n for n in nodes if n[1].top <= cy <= n[1].bottom]
-            row_known |= set(grid_rows[cy])
-        if node not in col_known:
-            cx, cy = node[1].center()
-            grid_cols[cx] = [n for n in nodes if n[1].left <= cx <= n[1].right]
-            col_known |= set(grid_cols[cx])
-    row_coords = sorted(grid_rows)
-    col_coords = sorted(grid_cols)
-    grid = [[''] * len(grid_cols) for row in grid_rows]
-    for i, row in enumerate(grid):
-        for j in range(len(row)):
-            r, c = row_coords[i], col_coords[j]
-            row[j] = next((n[0] for n in grid_rows[r] if n in grid_cols[c]), '0')
-    # Convert to textual description.
-    puzzle = '/'.join(''.join(row) for row in grid)
-    return puzzle if not return_coords else (puzzle, row_coords, col_coords)
+    return sections
+
+def _pack(pixels):
+    # Packs RGB colors into single integers. Works on tuples and arrays.
+    if isinstance(pixels, tuple):
+        return pixels[0] << 16 | pixels[1] << 8 | pixels[2]
+    return pixels[..., 0] << 16 | pixels[..., 1] << 8 | pixels[..., 2]
+
+def _label_cells(kinds, cxs, cys):
+    # Returns the cell of each pixel, and the connected component of each cell
+    # among the 8-connected occupied cells of the same kind.
+    span = int(cys.max()) + 3 if len(cys) else 1
+    keys = (kinds.astype(numpy.int64) * (int(cxs.max()) + 3 if len(cxs) else 1) + cxs + 1) * span + cys + 1
+    unique, cells = numpy.unique(keys, return_inverse=True)
+    position = {key: i for i, key in enumerate(unique.tolist())}
+    parents = list(range(len(unique)))
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+    for key, i in position.items():
+        for offset in (span - 1, span, span + 1, 1): # Neighbors to the right and below.
+            j = position.get(key + offset)
+            if j is not None:
+                parents[find(j)] = find(i)
+    return cells, numpy.array([find(i) for i in range(len(unique))], dtype=numpy.int64)
@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from lyner import GuidedDepthFirstSolver, LynerException
+
+# Puzzles that take more than one work unit, so that units are split.
+PUZZLES = ['C01Ccc/022c2c/aAa220/a1b23A/00222b/0B0B10',
+           'A111/1112/1211/111A']
+UNSOLVABLE = '02A00/22a00/a2300/A1000/BB000'
+
+class ParallelTest(unittest.TestCase):
+
+    def test_workers_find_the_serial_solution(self):
+        for puzzle in PUZZLES:
+            serial = GuidedDepthFirstSolver()
+            expected = serial.solve_puzzle(puzzle)
+            for jobs in (2, 3):
+                solver = GuidedDepthFirstSolver(jobs=jobs)
+                self.assertEqual(solver.solve_puzzle(puzzle), expected, (puzzle, jobs))
+
+    def test_workers_search_every_node_once(self):
+        serial = GuidedDepthFirstSolver()
+        with self.assertRaises(LynerException):
+            serial.solve_puzzle(UNSOLVABLE)
+        for jobs in (2, 3):
+            solver = GuidedDepthFirstSolver(jobs=jobs)
+            with self.assertRaises(LynerException):
+                solver.solve_puzzle(UNSOLVABLE)
+            stats = solver.stats
+            self.assertGreater(stats.counters['resplits'], 0)
+            self.assertEqual((stats.expanded, stats.backtracks), (serial.stats.expanded, serial.stats.backtracks))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import itertools
+import json
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from lyner import GuidedDepthFirstSolver
+
+# The search order, as measured on the recursive search that the explicit
+# stack replaced. Per puzzle and pruning: the expanded nodes, backtracks and
+# maximum depth of solving it, and the solutions, expanded nodes, backtracks
+# and memo hits of counting them.
+SEARCH_ORDER = [
+    ('A1111/11111/1111A',             False, (15, 0, 15), (291, 80693, 78798, 0)),
+    ('A1111/11111/1111A',             True,  (15, 0, 15), (291, 8143, 6248, 0)),
+    ('00021/0AA22/0a322/BB1a1',       False, (89, 67, 22), (1216, 123227, 122229, 28065)),
+    ('00021/0AA22/0a322/BB1a1',       True,  (26, 4, 22), (1216, 14454, 13456, 2636)),
+    ('C0000/0Cb00/01bB0/ABb0b/A0b2b', False, (15, 0, 15), (6, 309, 262, 18)),
+    ('C0000/0Cb00/01bB0/ABb0b/A0b2b', True,  (15, 0, 15), (6, 89, 42, 4)),
+    ('1A000/A1000/10bB0/bb100/01b1B', False, (45, 31, 14), (24, 2445, 2269, 0)),
+    ('1A000/A1000/10bB0/bb100/01b1B', True,  (17, 3, 14), (24, 296, 120, 0)),
+]
+
+class SearchOrderTest(unittest.TestCase):
+
+    def test_solving_expands_the_same_nodes(self):
+        for puzzle, prune, expected, _ in SEARCH_ORDER:
+            solver = GuidedDepthFirstSolver(prune=prune)
+            solver.solve_puzzle(puzzle)
+            stats = solver.stats
+            self.assertEqual((stats.expanded, stats.backtracks, stats.max_depth), expected, puzzle)
+
+    def test_counting_expands_the_same_nodes(self):
+        for puzzle, prune, _, expected in SEARCH_ORDER:
+            solver = GuidedDepthFirstSolver(prune=prune)
+            count = solver.count_solutions(puzzle)
+            stats = solver.stats
+            self.assertEqual((count, stats.expanded, stats.backtracks, stats.counters['memo hits']),
+                             expected, puzzle)
+
+    def test_compact_board_expands_the_same_nodes(self):
+        for puzzle, prune, _, _ in SEARCH_ORDER:
+            if prune:
+                continue # Only supported on the default board.
+            expected, compact = GuidedDepthFirstSolver(), GuidedDepthFirstSolver(compact=True)
+            self.assertEqual(compact.solve_puzzle(puzzle), expected.solve_puzzle(puzzle), puzzle)
+            self.assertEqual((compact.stats.expanded, compact.stats.backtracks),
+                             (expected.stats.expanded, expected.stats.backtracks), puzzle)
+            expected, compact = GuidedDepthFirstSolver(), GuidedDepthFirstSolver(compact=True)
+            self.assertEqual(compact.count_solutions(puzzle), expected.count_solutions(puzzle), puzzle)
+            self.assertEqual(compact.stats.counters['memo hits'], expected.stats.counters['memo hits'], puzzle)
+
+    def test_counting_stops_past_the_limit(self):
+        for puzzle, prune, _, _ in SEARCH_ORDER:
+            self.assertEqual(GuidedDepthFirstSolver(prune=prune).count_solutions(puzzle, 3), 4, puzzle)
+
+class SnapshotTest(unittest.TestCase):
+
+    def test_resumed_tasks_find_the_same_solutions(self):
+        # Runs every slice in a new task, resumed from the JSON snapshot of
+        # the last one.
+        for puzzle, prune, _, _ in SEARCH_ORDER:
+            expected = list(itertools.islice(GuidedDepthFirstSolver(prune=prune).solutions(puzzle), 20))
+            found, snapshot = [], None
+            for size in itertools.cycle((1, 2, 3, 5, 8, 13)):
+                task = GuidedDepthFirstSolver(prune=prune).task(puzzle, snapshot)
+                solution = task.step(max_expanded=size)
+                if solution is not None:
+                    found.append(solution)
+                if task.done or len(found) == len(expected):
+                    break
+                snapshot = json.loads(json.dumps(task.snapshot()))
+            self.assertEqual(found, expected, puzzle)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# A stand-in for xdotool, which records its arguments and its standard input.
+STAND_IN = textwrap.dedent('''\
+    #!/bin/sh
+    echo "$@" > "$0.args"
+    cat > "$0.stdin"
+''')
+
+# Acts out a solution through LiveSourceTarget, without the game window.
+REPLAY = textwrap.dedent('''\
+    from lyner.linux import LiveSourceTarget, _XWindow
+    target = object.__new__(LiveSourceTarget)
+    target.window = _XWindow('42')
+    target.row_coords, target.col_coords = [100, 200], [10, 20, 30]
+    target.collapse_runs = False
+    target.move_delay, target.button_delay = 0.01, 0.03
+    target.metrics = None
+    target._batch([[(0, 0), (0, 1)], [(1, 2), (1, 1)]]).run()
+''')
+
+class ReplayTest(unittest.TestCase):
+
+    def test_solution_is_sent_as_one_paced_script(self):
+        with tempfile.TemporaryDirectory() as directory:
+            program = os.path.join(directory, 'xdotool')
+            with open(program, 'w') as f:
+                f.write(STAND_IN)
+            os.chmod(program, stat.S_IRWXU)
+            env = dict(os.environ, LYNER_XDOTOOL=program)
+            subprocess.run([sys.executable, '-c', REPLAY], cwd=ROOT, env=env, check=True)
+            with open(program + '.args') as f:
+                self.assertEqual(f.read().split(), ['-'])
+            with open(program + '.stdin') as f:
+                script = f.read().splitlines()
+        self.assertEqual(script, ['mousemove --window 42 10 100', 'sleep 0.01',
+                                  'mousedown 1', 'sleep 0.03',
+                                  'mousemove --window 42 20 100', 'sleep 0.01',
+                                  'mouseup 1', 'sleep 0.03',
+                                  'mousemove --window 42 20 200', 'sleep 0.01', # Reversed by plan_replay.
+                                  'mousedown 1', 'sleep 0.03',
+                                  'mousemove --window 42 30 200', 'sleep 0.01',
+                                  'mouseup 1'])
+
+if __name__ == '__main__':
+    unittest.main()